@@ -3,11 +3,17 @@
 USAGE:
 
 python autogen.py make
+python autogen.py make --incremental
+python autogen.py make --resume  # Skip tutobooks done by an interrupted run
+python autogen.py make --dump-page-graph  # Save .build_cache/page_graph.jsonl
+python autogen.py make --stream  # Render pages as they are generated
+python autogen.py make --stream --keep-sources  # Also write `sources/`
 python autogen.py serve
 """
 
 import shutil
-import copy
+import collections
+import itertools
 import json
 import re
 import os
@@ -16,16 +22,26 @@ from pathlib import Path
 import http.server
 import socketserver
 import signal
+import urllib.parse
 import docstrings
 import jinja2
 import multiprocessing
 import autogen_utils
+import build_manifest
+import symbol_links
 
 from master import MASTER
 from examples_master import EXAMPLES_MASTER
 import tutobooks
+import tutobook_cache
+import tutobook_journal
+import tutobook_scheduler
 import generate_tf_guides
+import media_store
 import render_presets
+import nav_cache
+import page_graph
+import search_index
 
 
 EXAMPLES_GH_LOCATION = Path("keras-team") / "keras-io" / "blob" / "master" / "examples"
@@ -37,7 +53,14 @@ PROJECT_URL = {
     "keras_hub": f"{KERAS_TEAM_GH}/keras-hub/tree/v0.18.1/",
     "tf_keras": f"{KERAS_TEAM_GH}/tf-keras/tree/v2.18.0/",
 }
-USE_MULTIPROCESSING = False
+USE_MULTIPROCESSING = True
+# Number of HTML rendering processes. Defaults to the CPU count.
+RENDER_PROCESSES = None
+# Pages sent to a rendering process at a time. Kept small so that streamed
+# pages start rendering as soon as they are generated.
+RENDER_CHUNKSIZE = 4
+# Optional variants (e.g. "webp", "avif") generated next to each image.
+MEDIA_VARIANTS = ()
 
 
 class KerasIO:
@@ -54,6 +77,9 @@ class KerasIO:
         redirects_dir,
         refresh_guides=False,
         refresh_examples=False,
+        cache_dir=None,
+        incremental=False,
+        resume=False,
     ):
         self.master = master
         self.url = url
@@ -66,10 +92,71 @@ class KerasIO:
         self.redirects_dir = redirects_dir
         self.refresh_guides = refresh_guides
         self.refresh_examples = refresh_examples
+        self.cache_dir = cache_dir
+        self.incremental = incremental
+        self.resume = resume
 
         self.make_examples_master()
         self.nav = self.make_nav_index()
-        self.docstring_printer = docstrings.KerasDocumentationGenerator(PROJECT_URL)
+        self.nav_cache = nav_cache.NavCache(self.nav)
+        self.docstring_printer = docstrings.KerasDocumentationGenerator(
+            PROJECT_URL,
+            cache_dir=None if cache_dir is None else Path(cache_dir) / "docstrings",
+        )
+
+        # Any change to the generator code itself invalidates every page.
+        scripts_dir = Path(__file__).parent
+        self.code_digest = build_manifest.hash_files(
+            [
+                scripts_dir / "autogen.py",
+                scripts_dir / "autogen_utils.py",
+                scripts_dir / "docstrings.py",
+                scripts_dir / "nav_cache.py",
+                scripts_dir / "page_graph.py",
+                scripts_dir / "render_presets.py",
+                scripts_dir / "search_index.py",
+                scripts_dir / "symbol_links.py",
+            ]
+        )
+        self.sources_manifest = self.make_manifest("sources_manifest.json")
+        self.site_manifest = self.make_manifest("site_manifest.json")
+        self._jinja_env = None
+        self.page_graph = page_graph.PageGraph()
+
+    def __getstate__(self):
+        # The jinja environment isn't picklable: render workers build their own.
+        state = self.__dict__.copy()
+        state["_jinja_env"] = None
+        return state
+
+    def get_theme_template(self, name):
+        """Return the compiled theme template `name` (e.g. `"base.html"`).
+
+        Each template is parsed and compiled at most once per process, and the
+        compiled bytecode is cached on disk across builds.
+        """
+        if self._jinja_env is None:
+            bytecode_cache = None
+            if self.cache_dir is not None:
+                jinja_cache_dir = Path(self.cache_dir) / "jinja"
+                os.makedirs(jinja_cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(str(jinja_cache_dir))
+            self._jinja_env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(self.theme_dir),
+                bytecode_cache=bytecode_cache,
+                # Theme files don't change during a build.
+                auto_reload=False,
+            )
+        return self._jinja_env.get_template(name)
+
+    def get_nav_html(self, relative_url=None):
+        """Sidebar of the page at `relative_url` (see `nav_cache`)."""
+        return self.nav_cache.get(relative_url, self.get_theme_template("nav.html"))
+
+    def make_manifest(self, fname):
+        if self.cache_dir is None:
+            return build_manifest.BuildManifest()
+        return build_manifest.BuildManifest(Path(self.cache_dir) / fname)
 
     def make_examples_master(self):
         for entry in self.master["children"]:
@@ -97,19 +184,33 @@ class KerasIO:
 
     def make_md_sources(self):
         print("Generating md sources")
-        if os.path.exists(self.md_sources_dir):
-            print("Clearing", self.md_sources_dir)
-            shutil.rmtree(self.md_sources_dir)
-        os.makedirs(self.md_sources_dir)
+        self.prepare_md_sources()
+
+        # Recursively generate all md sources based on the MASTER tree
+        for _ in self.iter_md_pages(self.master, path_stack=[], title_stack=[]):
+            pass
+        self.sources_manifest.remove_stale()
+        self.sources_manifest.save()
+
+    def prepare_md_sources(self, write_sources=True):
+        """Clear the md sources (if written) and build the tutobooks."""
+        if write_sources:
+            if self.incremental:
+                print("Incremental build: only regenerating changed pages")
+            elif os.path.exists(self.md_sources_dir):
+                print("Clearing", self.md_sources_dir)
+                shutil.rmtree(self.md_sources_dir)
+            if not os.path.exists(self.md_sources_dir):
+                os.makedirs(self.md_sources_dir)
+        self.page_graph = page_graph.PageGraph()
 
         self.make_tutobook_sources(
-            guides=self.refresh_guides, examples=self.refresh_examples
+            guides=self.refresh_guides,
+            examples=self.refresh_examples,
+            resume=self.resume,
         )
         self.sync_tutobook_templates()
 
-        # Recursively generate all md sources based on the MASTER tree
-        self.make_md_source_for_entry(self.master, path_stack=[], title_stack=[])
-
     def preprocess_tutobook_md_source(
         self, md_content, fname, github_repo_dir, img_dir, site_img_dir
     ):
@@ -151,32 +252,138 @@ class KerasIO:
             md_content = md_content.replace("[37m ", "")
         return md_content
 
-    def make_tutobook_sources_for_directory(
+    def get_tutobook_jobs_for_directory(
         self, src_dir, target_dir, img_dir, site_img_dir, github_repo_dir
     ):
-        # e.g.
-        # make_tutobook_sources_for_directory(
-        #    "examples/nlp", "examples/nlp/md", "examples/nlp/img", "img/examples/nlp")
-        print("Making tutobook sources for", src_dir)
+        """List the tutobook jobs (see `tutobook_scheduler`) for a directory.
 
+        e.g.
+        get_tutobook_jobs_for_directory(
+           "examples/nlp", "examples/nlp/md", "examples/nlp/img", "img/examples/nlp")
+        """
         working_ipynb_dir = Path(src_dir) / "ipynb"
         if not os.path.exists(working_ipynb_dir):
             os.makedirs(working_ipynb_dir)
 
-        for fname in os.listdir(src_dir):
+        jobs = []
+        for fname in sorted(os.listdir(src_dir)):
             if fname.endswith(".py"):
-                print("...Processing", fname)
                 name = fname[:-3]
-                py_path = Path(src_dir) / fname
-                nb_path = working_ipynb_dir / (name + ".ipynb")
-                md_path = Path(target_dir) / (name + ".md")
-                tutobooks.py_to_md(py_path, nb_path, md_path, img_dir)
-                md_content = open(md_path).read()
-                md_content = self.preprocess_tutobook_md_source(
-                    md_content, fname, github_repo_dir, img_dir, site_img_dir
+                jobs.append(
+                    {
+                        "name": Path(src_dir).name + "/" + name,
+                        "py_path": Path(src_dir) / fname,
+                        "nb_path": working_ipynb_dir / (name + ".ipynb"),
+                        "md_path": Path(target_dir) / (name + ".md"),
+                        "img_dir": img_dir,
+                        # Used to post-process the generated md file.
+                        "fname": fname,
+                        "github_repo_dir": github_repo_dir,
+                        "site_img_dir": site_img_dir,
+                        "media_store": self.get_media_store(),
+                    }
                 )
-                open(md_path, "w").write(md_content)
-        shutil.rmtree(working_ipynb_dir)
+        return jobs
+
+    def run_tutobook_jobs(self, jobs, journal=None):
+        """Execute tutobooks concurrently, then post-process their md files.
+
+        Tutobooks found in the notebook cache (see `tutobook_cache`) aren't
+        executed again. Each tutobook is finished (see
+        `finish_tutobook_job`) as soon as it is done.
+        """
+        cache_dir = None if self.cache_dir is None else Path(self.cache_dir)
+        jobs_to_run = jobs
+        notebook_cache = None
+        if cache_dir is not None:
+            notebook_cache = tutobook_cache.NotebookCache(cache_dir / "notebooks")
+            jobs_to_run = []
+            for job in jobs:
+                job["key_inputs"] = notebook_cache.get_key_inputs(
+                    job["py_path"], job["img_dir"]
+                )
+                job["cache_key"] = notebook_cache.get_key(job["key_inputs"])
+                if notebook_cache.restore(
+                    job["cache_key"], job["md_path"], job["img_dir"]
+                ):
+                    print("...Using cached outputs for", job["name"])
+                    self.finish_tutobook_job(job, journal=journal)
+                else:
+                    job["executed_nb_path"] = Path(job["nb_path"]).with_suffix(
+                        ".executed.ipynb"
+                    )
+                    jobs_to_run.append(job)
+            print(
+                f"{len(jobs) - len(jobs_to_run)} tutobooks found in the cache, "
+                f"{len(jobs_to_run)} to execute"
+            )
+
+        failed = []
+
+        def on_result(job, result):
+            if not result["success"]:
+                failed.append(job["name"])
+                return
+            if notebook_cache is not None:
+                notebook_cache.store(
+                    job["cache_key"],
+                    job["key_inputs"],
+                    job["name"],
+                    job["executed_nb_path"],
+                    job["md_path"],
+                    job["img_dir"],
+                )
+            self.finish_tutobook_job(job, journal=journal)
+
+        if jobs_to_run:
+            tutobook_scheduler.run_jobs(
+                jobs_to_run,
+                runtimes_path=cache_dir and cache_dir / "tutobook_runtimes.json",
+                report_path=cache_dir and cache_dir / "tutobook_report.json",
+                on_result=on_result,
+            )
+        for working_ipynb_dir in set(Path(job["nb_path"]).parent for job in jobs):
+            shutil.rmtree(working_ipynb_dir, ignore_errors=True)
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} tutobooks failed to run: {', '.join(failed)}. "
+                "See the report above for details."
+            )
+
+    def finish_tutobook_job(self, job, journal=None):
+        """Post-process the md file of a tutobook that ran successfully.
+
+        Jobs generated in a staging area (with `target_md_path` and
+        `target_img_dir` keys) are then swapped into place, and recorded in
+        the run `journal` (see `tutobook_journal`).
+        """
+        md_content = open(job["md_path"]).read()
+        md_content = self.preprocess_tutobook_md_source(
+            md_content,
+            job["fname"],
+            job["github_repo_dir"],
+            job["img_dir"],
+            job["site_img_dir"],
+        )
+        open(job["md_path"], "w").write(md_content)
+        if "target_md_path" in job:
+            name = Path(job["md_path"]).stem
+            staged_img_dir = Path(job["img_dir"]) / name
+            target_img_dir = Path(job["target_img_dir"]) / name
+            # Images first, so that the md file never refers to missing ones.
+            if os.path.exists(staged_img_dir):
+                tutobook_journal.swap_in(staged_img_dir, target_img_dir)
+            elif os.path.exists(target_img_dir):
+                shutil.rmtree(target_img_dir)
+            staged_profile_path = tutobooks.get_profile_path(job["md_path"])
+            if os.path.exists(staged_profile_path):
+                tutobook_journal.swap_in(
+                    staged_profile_path,
+                    tutobooks.get_profile_path(job["target_md_path"]),
+                )
+            tutobook_journal.swap_in(job["md_path"], job["target_md_path"])
+        if journal is not None:
+            journal.record(job)
 
     def make_tutobook_ipynbs(self):
         def process_one_dir(src_dir, target_dir):
@@ -234,7 +441,14 @@ class KerasIO:
 
         self.disable_warnings()
         tutobooks.py_to_nb(py_path, nb_path, fill_outputs=False)
-        tutobooks.py_to_md(py_path, nb_path, md_path, img_dir, working_dir=working_dir)
+        tutobooks.py_to_md(
+            py_path,
+            nb_path,
+            md_path,
+            img_dir,
+            working_dir=working_dir,
+            store=self.get_media_store(),
+        )
 
         md_content = open(md_path).read()
         github_repo_dir = str(EXAMPLES_GH_LOCATION / folder)
@@ -271,7 +485,14 @@ class KerasIO:
 
         self.disable_warnings()
         tutobooks.py_to_nb(py_path, nb_path, fill_outputs=False)
-        tutobooks.py_to_md(py_path, nb_path, md_path, img_dir, working_dir=working_dir)
+        tutobooks.py_to_md(
+            py_path,
+            nb_path,
+            md_path,
+            img_dir,
+            working_dir=working_dir,
+            store=self.get_media_store(),
+        )
 
         md_content = open(md_path).read()
         md_content = md_content.replace("../guides/img/", "/img/guides/")
@@ -287,7 +508,7 @@ class KerasIO:
         os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
         os.environ["AUTOGRAPH_VERBOSITY"] = "0"
 
-    def make_tutobook_sources(self, guides=True, examples=True):
+    def make_tutobook_sources(self, guides=True, examples=True, resume=False):
         """Populate `examples/nlp/md`, `examples/nlp/img/`, etc.
 
         - guides/md/ & /png/
@@ -297,46 +518,61 @@ class KerasIO:
         - examples/timeseries/md/ & /png/
         - examples/generative_dl/md/ & /png/
         - examples/keras_recipes/md/ & /png/
+
+        Tutobooks are generated in `<dir>/staging/` and swapped into place one
+        by one (see `tutobook_journal`). With `resume`, the tutobooks already
+        done by a previous, interrupted run are skipped.
         """
-        # Guides
+        src_dirs = []
         if guides:
-            target_dir = Path(self.guides_dir) / "md"
-            img_dir = Path(self.guides_dir) / "img"
-            if os.path.exists(target_dir):
-                shutil.rmtree(target_dir)
-            if os.path.exists(img_dir):
-                shutil.rmtree(img_dir)
-            os.makedirs(target_dir)
-            os.makedirs(img_dir)
-            self.make_tutobook_sources_for_directory(
-                src_dir=Path(self.guides_dir),
-                target_dir=target_dir,
-                img_dir=img_dir,
-                site_img_dir="img/guides/",
-                github_repo_dir=str(GUIDES_GH_LOCATION),
-            )
-
-        # Examples
+            src_dirs.append((Path(self.guides_dir), "img/guides/", GUIDES_GH_LOCATION))
         if examples:
-            for name in os.listdir(self.examples_dir):
+            for name in sorted(os.listdir(self.examples_dir)):
                 path = Path(self.examples_dir) / name
                 if os.path.isdir(path):
-                    target_dir = path / "md"
-                    img_dir = path / "img"
-                    if os.path.exists(target_dir):
-                        shutil.rmtree(target_dir)
-                    if os.path.exists(img_dir):
-                        shutil.rmtree(img_dir)
-                    os.makedirs(target_dir)
-                    os.makedirs(img_dir)
-                    self.make_tutobook_sources_for_directory(
-                        src_dir=path,  # e.g. examples/nlp
-                        target_dir=target_dir,  # e.g. examples/nlp/md
-                        img_dir=img_dir,  # e.g. examples/nlp/img
-                        site_img_dir="img/examples/" + name,  # e.g. img/examples/nlp
-                        github_repo_dir=str(EXAMPLES_GH_LOCATION / name),
+                    src_dirs.append(
+                        (path, "img/examples/" + name, EXAMPLES_GH_LOCATION / name)
                     )
 
+        jobs = []
+        for src_dir, site_img_dir, github_repo_dir in src_dirs:
+            target_dir = src_dir / "md"  # e.g. examples/nlp/md
+            img_dir = src_dir / "img"  # e.g. examples/nlp/img
+            staging_dir = src_dir / "staging"
+            for path in (target_dir, img_dir, staging_dir / "md", staging_dir / "img"):
+                if not os.path.exists(path):
+                    os.makedirs(path)
+            dir_jobs = self.get_tutobook_jobs_for_directory(
+                src_dir=src_dir,
+                target_dir=staging_dir / "md",
+                img_dir=staging_dir / "img",
+                site_img_dir=site_img_dir,  # e.g. img/examples/nlp
+                github_repo_dir=str(github_repo_dir),
+            )
+            for job in dir_jobs:
+                job["target_md_path"] = target_dir / Path(job["md_path"]).name
+                job["target_img_dir"] = img_dir
+            remove_stale_tutobook_outputs(target_dir, img_dir, dir_jobs)
+            jobs += dir_jobs
+        if not jobs:
+            return
+
+        journal = None
+        if self.cache_dir is not None:
+            journal = tutobook_journal.RunJournal(
+                Path(self.cache_dir) / "tutobook_journal.jsonl", resume=resume
+            )
+        elif resume:
+            raise ValueError("Resuming a run requires a `cache_dir`.")
+        if resume:
+            jobs = [job for job in jobs if not journal.is_done(job)]
+            print(f"{len(jobs)} tutobooks left to generate")
+        try:
+            self.run_tutobook_jobs(jobs, journal=journal)
+        finally:
+            for src_dir, _, _ in src_dirs:
+                shutil.rmtree(src_dir / "staging", ignore_errors=True)
+
     def sync_tutobook_templates(self):
         """Copy generated `.md`s to source_dir.
 
@@ -430,19 +666,20 @@ class KerasIO:
                         f.write(md_content)
 
     def sync_tutobook_media(self):
-        """Copy generated `.png`s to site_dir.
+        """Link generated images to site_dir, through the media store.
 
         Note: intro guides are copied to getting_started.
 
         guides/img/ -> site/img/guides/
         examples/*/img/ -> site/img/examples/*/
         """
-        # Copy images for guide notebooks
+        store = self.get_media_store()
+        # Images for guide notebooks
         for name in os.listdir(Path(self.guides_dir) / "img"):
             path = Path(self.guides_dir) / "img" / name
             if os.path.isdir(path):
-                shutil.copytree(path, Path(self.site_dir) / "img" / "guides" / name)
-        # Copy images for examples notebooks
+                store.sync_dir(path, Path(self.site_dir) / "img" / "guides" / name)
+        # Images for examples notebooks
         for dir_name in os.listdir(Path(self.examples_dir)):
             dir_path = Path(self.examples_dir) / dir_name
             if os.path.isdir(dir_path):
@@ -450,16 +687,17 @@ class KerasIO:
                     continue  # No media was generated for this tutobook.
 
                 dst_dir = Path(self.site_dir) / "img" / "examples" / dir_name
-                if not os.path.exists(dst_dir):
-                    os.makedirs(dst_dir)
-
                 for name in os.listdir(dir_path / "img"):
                     path = dir_path / "img" / name
                     if os.path.isdir(path):
-                        shutil.copytree(
-                            path,
-                            Path(self.site_dir) / "img" / "examples" / dir_name / name,
-                        )
+                        store.sync_dir(path, dst_dir / name)
+
+    def get_media_store(self):
+        if self.cache_dir is None:
+            return media_store.MediaStore(variants=MEDIA_VARIANTS)
+        return media_store.MediaStore(
+            Path(self.cache_dir) / "media", variants=MEDIA_VARIANTS
+        )
 
     def make_nav_index(self):
         max_depth = 4
@@ -492,14 +730,22 @@ class KerasIO:
             for entry in self.master["children"]
         ]
 
-    def make_md_source_for_entry(self, entry, path_stack, title_stack):
+    def iter_md_pages(
+        self, entry, path_stack, title_stack, parent_key=None, write_sources=True
+    ):
+        """Generate the md pages of `entry` and its descendants.
+
+        Yields a `page_graph.Page` as soon as each page is generated, in MASTER
+        order. With `write_sources=False`, nothing is written to the md sources
+        directory and every page is generated again.
+        """
         path = entry["path"]
         if path != "/":
             path_stack.append(path)
             title_stack.append(entry["title"])
         print("...Processing", Path(*path_stack))
         parent_url = self.url + str(Path(*path_stack)) + "/"
-        if path.endswith("/"):
+        if path.endswith("/") and write_sources:
             dir_path = Path(self.md_sources_dir) / Path(*path_stack)
             if not os.path.exists(dir_path):
                 os.makedirs(dir_path)
@@ -524,6 +770,49 @@ class KerasIO:
             template = "# " + entry["title"] + "\n\n" + template
         generate = entry.get("generate")
         children = entry.get("children")
+
+        source_path = Path(self.md_sources_dir) / Path(*path_stack)
+        if path.endswith("/"):
+            md_source_path = source_path / "index.md"
+        else:
+            md_source_path = source_path.with_suffix(".md")
+
+        page_key = os.path.relpath(md_source_path, self.md_sources_dir)
+        digest = self.get_md_source_digest(entry, template, path_stack, title_stack)
+        if (
+            write_sources
+            and self.incremental
+            and self.sources_manifest.is_fresh(page_key, digest)
+        ):
+            with open(md_source_path, encoding="utf8") as f:
+                md_content = f.read()
+            # The outline is made from the generated md source.
+            outline = (
+                autogen_utils.make_outline(md_content)
+                if entry.get("outline", True)
+                else []
+            )
+            record = self.add_page_record(
+                entry,
+                page_key,
+                parent_key,
+                md_source_path,
+                path_stack,
+                title_stack,
+                outline,
+            )
+            yield page_graph.Page(record, md_content)
+            if children:
+                for entry in children:
+                    yield from self.iter_md_pages(
+                        entry,
+                        path_stack[:],
+                        title_stack[:],
+                        parent_key=page_key,
+                        write_sources=write_sources,
+                    )
+            return
+
         if generate:
             generated_md = ""
             for element in generate:
@@ -550,18 +839,46 @@ class KerasIO:
             template = template.replace("{{toc}}", toc)
         if "keras_hub/" in path_stack:
             template = render_presets.render_tags(template)
-        source_path = Path(self.md_sources_dir) / Path(*path_stack)
-        if path.endswith("/"):
-            md_source_path = source_path / "index.md"
-            metadata_path = source_path / "index_metadata.json"
-        else:
-            md_source_path = source_path.with_suffix(".md")
-            metadata_path = str(source_path) + "_metadata.json"
 
-        # Save md source file
-        autogen_utils.save_file(md_source_path, template)
+        if write_sources:
+            # Save md source file
+            autogen_utils.save_file(md_source_path, template)
+            self.sources_manifest.record(page_key, digest, [md_source_path])
+        outline = (
+            autogen_utils.make_outline(template) if entry.get("outline", True) else []
+        )
+        record = self.add_page_record(
+            entry,
+            page_key,
+            parent_key,
+            md_source_path,
+            path_stack,
+            title_stack,
+            outline,
+        )
+        yield page_graph.Page(record, template)
+
+        if children:
+            for entry in children:
+                yield from self.iter_md_pages(
+                    entry,
+                    path_stack[:],
+                    title_stack[:],
+                    parent_key=page_key,
+                    write_sources=write_sources,
+                )
 
-        # Save metadata file
+    def add_page_record(
+        self,
+        entry,
+        page_key,
+        parent_key,
+        md_source_path,
+        path_stack,
+        title_stack,
+        outline,
+    ):
+        """Add the page of a MASTER entry to the page graph and return its record."""
         location_history = []
         for i in range(len(path_stack)):
             stripped_path_stack = [s.strip("/") for s in path_stack[: i + 1]]
@@ -572,26 +889,38 @@ class KerasIO:
                     "title": title_stack[i],
                 }
             )
-        metadata = json.dumps(
-            {
-                "location_history": location_history[:-1],
-                "outline": (
-                    autogen_utils.make_outline(template)
-                    if entry.get("outline", True)
-                    else []
-                ),
-                "location": "/"
-                + "/".join([s.replace("/", "") for s in path_stack])
-                + "/",
-                "url": parent_url,
-                "title": entry["title"],
-            }
+        record = page_graph.PageRecord(
+            page_key=page_key,
+            src_location=str(Path(md_source_path).parent),
+            fname=Path(md_source_path).name,
+            url=self.url + str(Path(*path_stack)) + "/",
+            location="/" + "/".join([s.replace("/", "") for s in path_stack]) + "/",
+            title=entry["title"],
+            location_history=location_history[:-1],
+            outline=outline,
+            parent=parent_key,
         )
-        autogen_utils.save_file(metadata_path, metadata)
+        self.page_graph.add(record)
+        return record
 
-        if children:
-            for entry in children:
-                self.make_md_source_for_entry(entry, path_stack[:], title_stack[:])
+    def get_md_source_digest(self, entry, template, path_stack, title_stack):
+        """Digest of all the inputs of the md source page for `entry`."""
+        fingerprints = [
+            docstrings.get_fingerprint(element) for element in entry.get("generate", [])
+        ]
+        presets_version = None
+        if "keras_hub/" in path_stack and render_presets.keras_hub is not None:
+            presets_version = render_presets.keras_hub.__version__
+        return build_manifest.hash_content(
+            self.code_digest,
+            self.url,
+            template,
+            entry,
+            path_stack,
+            title_stack,
+            fingerprints,
+            presets_version,
+        )
 
     def make_symbol_to_link_map(self):
         def recursive_make_map(entry, current_url):
@@ -621,6 +950,7 @@ class KerasIO:
             symbol = f"`{key}`"
             link = f"[{symbol}]({value})"
             self._symbol_to_link_map[symbol] = link
+        self.symbol_linker = symbol_links.SymbolLinker(self._symbol_to_link_map)
 
     def generate_examples_landing_page(self):
         """Create the html file /examples/index.html.
@@ -677,12 +1007,9 @@ class KerasIO:
         with open(Path(self.templates_dir) / "examples/index.md") as f:
             md_content = f.read()
 
-        with open(Path(self.md_sources_dir) / "examples/index_metadata.json") as f:
-            metadata = json.loads(f.read())
+        record = self.page_graph["examples/index.md"]
 
-        examples_template = jinja2.Template(
-            open(Path(self.theme_dir) / "examples.html").read()
-        )
+        examples_template = self.get_theme_template("examples.html")
         html_example_cards = examples_template.render(
             {"categories": categories_to_render, "legend": True}
         )
@@ -691,37 +1018,22 @@ class KerasIO:
         html_content = html_content.replace(
             "<p>{{examples_list}}</p>", html_example_cards
         )
-        html_content = insert_title_ids_in_html(html_content)
+        html_content = autogen_utils.insert_title_ids_in_html(html_content)
 
         relative_url = "/examples/"
-        local_nav = [
-            autogen_utils.set_active_flag_in_nav_entry(entry, relative_url)
-            for entry in self.nav
-        ]
         self.render_single_docs_page_from_html(
             target_path=Path(self.site_dir) / "examples/index.html",
             title="Code examples",
             html_content=html_content,
-            location_history=metadata["location_history"],
-            outline=metadata["outline"],
-            local_nav=local_nav,
+            location_history=record.location_history,
+            outline=record.outline,
             relative_url=relative_url,
         )
 
         # Save per-category landing pages
         for category_name, category_path in zip(category_names, category_paths):
-            with open(
-                Path(self.md_sources_dir)
-                / "examples"
-                / category_path
-                / "index_metadata.json"
-            ) as f:
-                metadata = json.loads(f.read())
+            record = self.page_graph[str(Path("examples") / category_path / "index.md")]
             relative_url = f"/examples/{category_path}"
-            local_nav = [
-                autogen_utils.set_active_flag_in_nav_entry(entry, relative_url)
-                for entry in self.nav
-            ]
             to_render = [
                 cat for cat in categories_to_render if cat["title"] == category_name
             ]
@@ -735,64 +1047,162 @@ class KerasIO:
                 / "index.html",
                 title=category_name,
                 html_content=html_example_cards,
-                location_history=metadata["location_history"],
-                outline=metadata["outline"],
-                local_nav=local_nav,
+                location_history=record.location_history,
+                outline=record.outline,
                 relative_url=relative_url,
             )
 
     def render_md_sources_to_html(self):
+        site_digest = self.start_site()
+        # Read the md sources in a deterministic order.
+        pages = []
+        for record in self.page_graph.records():
+            with open(Path(record.src_location) / record.fname, encoding="utf-8") as f:
+                pages.append(page_graph.Page(record, f.read()))
+        page_urls, search_documents = self.render_pages(pages, site_digest)
+        self.finish_site(page_urls, search_documents)
+
+    def make_streaming(self, keep_sources=False):
+        """Generate and render all pages in a single pass.
+
+        Each MASTER entry goes from its template to its HTML file in memory,
+        and pages start rendering while the next ones are still being
+        generated. The md sources are only written with `keep_sources=True`.
+        """
+        print("Generating and rendering pages")
+        self.prepare_md_sources(write_sources=keep_sources)
+        site_digest = self.start_site()
+        pages = self.iter_md_pages(
+            self.master, path_stack=[], title_stack=[], write_sources=keep_sources
+        )
+        page_urls, search_documents = self.render_pages(pages, site_digest)
+        if keep_sources:
+            self.sources_manifest.remove_stale()
+            self.sources_manifest.save()
+        self.finish_site(page_urls, search_documents)
+
+    def start_site(self):
+        """Prepare the site directory, and return the digest of the inputs
+        shared by every page: theme, nav and symbol links."""
         self.make_symbol_to_link_map()
         print("Rendering md sources to HTML")
-        base_template = jinja2.Template(open(Path(self.theme_dir) / "base.html").read())
-        docs_template = jinja2.Template(open(Path(self.theme_dir) / "docs.html").read())
-
-        all_urls_list = []
-
-        if os.path.exists(self.site_dir):
+        if self.incremental:
+            print("Incremental build: only rendering changed pages")
+        elif os.path.exists(self.site_dir):
             print("Clearing", self.site_dir)
             shutil.rmtree(self.site_dir)
 
-        if USE_MULTIPROCESSING:
-            for src_location, _, fnames in os.walk(self.md_sources_dir):
-                pool = multiprocessing.Pool(processes=8)
-                workers = [
-                    pool.apply_async(
-                        self.render_single_file,
-                        args=(src_location, fname, self.nav),
-                    )
-                    for fname in fnames
+        return build_manifest.hash_content(
+            self.code_digest,
+            self.url,
+            build_manifest.hash_files(
+                [
+                    Path(self.theme_dir) / "base.html",
+                    Path(self.theme_dir) / "docs.html",
+                    Path(self.theme_dir) / "nav.html",
                 ]
+            ),
+            self.nav,
+            self._symbol_to_link_map,
+        )
 
-                for worker in workers:
-                    url = worker.get()
-                    if url is not None:
-                        all_urls_list.append(url)
-                pool.close()
-                pool.join()
+    def render_pages(self, pages, site_digest):
+        """Render an iterable of `page_graph.Page`s to HTML, as they come.
+
+        Returns the relative URLs and the search documents of all pages, by
+        page key.
+        """
+        previous_documents = self.load_search_documents()
+        page_urls = {}
+        search_documents = {}
+
+        def get_tasks():
+            # With multiprocessing, this runs in a thread of the pool.
+            for page in pages:
+                record = page.record
+                digest = build_manifest.hash_content(
+                    site_digest, page.md_content, record.to_dict()
+                )
+                previous_document = previous_documents.get(record.page_key, {})
+                if (
+                    self.incremental
+                    and self.site_manifest.is_fresh(record.page_key, digest)
+                    and previous_document.get("digest") == digest
+                ):
+                    _, relative_url = self.get_target_path_and_url(
+                        record.src_location, record.fname
+                    )
+                    page_urls[record.page_key] = relative_url
+                    search_documents[record.page_key] = previous_document
+                    continue
+                yield page, digest
+
+        tasks = get_tasks()
+        # Only start rendering processes if there are at least two pages.
+        first_tasks = list(itertools.islice(tasks, 2))
+        tasks = itertools.chain(first_tasks, tasks)
+        if USE_MULTIPROCESSING and len(first_tasks) > 1:
+            processes = RENDER_PROCESSES or os.cpu_count()
+            print(f"Rendering pages with {processes} processes")
+            # Render every sidebar once, before it is copied to the workers.
+            self.nav_cache.prerender(self.get_theme_template("nav.html"))
+            with multiprocessing.Pool(
+                processes=processes,
+                initializer=init_render_worker,
+                initargs=(self,),
+            ) as pool:
+                results = list(
+                    pool.imap(render_page_in_worker, tasks, RENDER_CHUNKSIZE)
+                )
         else:
-            for src_location, _, fnames in os.walk(self.md_sources_dir):
-                for fname in fnames:
-                    print("...Rendering", fname)
-                    self.render_single_file(src_location, fname, self.nav)
+            results = [self.render_page_task(task) for task in tasks]
+        for record, digest, (url, document) in results:
+            page_urls[record.page_key] = url
+            search_documents[record.page_key] = {"digest": digest, "document": document}
+            self.record_rendered_page(
+                record.page_key, record.src_location, record.fname, digest
+            )
+        return page_urls, search_documents
+
+    def finish_site(self, page_urls, search_documents):
+        """Write everything besides the md pages: search index, assets,
+        special pages, sitemap and redirects."""
+        base_template = self.get_theme_template("base.html")
+        docs_template = self.get_theme_template("docs.html")
+        all_urls_list = [page_urls[page_key] for page_key in sorted(page_urls)]
+        self.save_search_documents(search_documents)
+        self.make_search_index(
+            [entry["document"] for entry in search_documents.values()]
+        )
+
+        self.site_manifest.remove_stale()
+        self.site_manifest.save()
 
         # Images & css
-        shutil.copytree(Path(self.theme_dir) / "css", Path(self.site_dir) / "css")
-        shutil.copytree(Path(self.theme_dir) / "img", Path(self.site_dir) / "img")
+        shutil.copytree(
+            Path(self.theme_dir) / "css",
+            Path(self.site_dir) / "css",
+            dirs_exist_ok=True,
+        )
+        shutil.copytree(
+            Path(self.theme_dir) / "img",
+            Path(self.site_dir) / "img",
+            dirs_exist_ok=True,
+        )
 
         # Landing page
-        landing_template = jinja2.Template(
-            open(Path(self.theme_dir) / "landing.html").read()
-        )
+        landing_template = self.get_theme_template("landing.html")
         landing_page = landing_template.render({"base_url": self.url})
         autogen_utils.save_file(Path(self.site_dir) / "index.html", landing_page)
 
         # Search page
-        search_main = open(Path(self.theme_dir) / "search.html").read()
+        search_main = self.get_theme_template("search.html").render(
+            {"base_url": self.url}
+        )
         search_page = base_template.render(
             {
                 "title": "Search Keras documentation",
-                "nav": self.nav,
+                "nav_html": self.get_nav_html(),
                 "base_url": self.url,
                 "main": search_main,
             }
@@ -803,7 +1213,7 @@ class KerasIO:
         page404 = base_template.render(
             {
                 "title": "Page not found",
-                "nav": self.nav,
+                "nav_html": self.get_nav_html(),
                 "base_url": self.url,
                 "main": docs_template.render(
                     {
@@ -817,9 +1227,7 @@ class KerasIO:
         autogen_utils.save_file(Path(self.site_dir) / "404.html", page404)
 
         # Keras 3 announcement page
-        keras_3_template = jinja2.Template(
-            open(Path(self.theme_dir) / "keras_3.html").read()
-        )
+        keras_3_template = self.get_theme_template("keras_3.html")
         md_content = open(
             Path(self.templates_dir) / "keras_3" / "keras_3_announcement.md"
         ).read()
@@ -849,23 +1257,12 @@ class KerasIO:
         # Examples landing page
         self.generate_examples_landing_page()
 
-    def render_single_file(self, src_location, fname, nav):
-        if not fname.endswith(".md"):
-            return
+    def record_rendered_page(self, page_key, src_location, fname, digest):
+        target_path, _ = self.get_target_path_and_url(src_location, fname)
+        self.site_manifest.record(page_key, digest, [target_path])
 
-        src_dir = Path(src_location)
+    def get_target_path_and_url(self, src_location, fname):
         target_dir = src_location.replace(self.md_sources_dir, self.site_dir)
-        if not os.path.exists(target_dir):
-            try:
-                os.makedirs(target_dir)
-            except FileExistsError:
-                # Might be created by a concurrent process.
-                pass
-
-        # Load metadata for page
-        with open(str(Path(src_location) / fname[:-3]) + "_metadata.json") as f:
-            metadata = json.loads(f.read())
-
         if fname == "index.md":
             # Render as index.html
             target_path = Path(target_dir) / "index.html"
@@ -875,73 +1272,84 @@ class KerasIO:
             # Render as fname_no_ext/index.tml
             fname_no_ext = ".".join(fname.split(".")[:-1])
             full_target_dir = Path(target_dir) / fname_no_ext
-            os.makedirs(full_target_dir)
             target_path = full_target_dir / "index.html"
             relative_url = (str(full_target_dir) + "/").replace(self.site_dir, "/")
             relative_url = relative_url.replace("//", "/")
             if not relative_url.endswith("/"):
                 relative_url += "/"
+        return target_path, relative_url
+
+    def load_search_documents(self):
+        """Search documents of the previous build, keyed by page."""
+        if self.cache_dir is None:
+            return {}
+        path = Path(self.cache_dir) / "search_documents.json"
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.loads(f.read())
+
+    def save_search_documents(self, search_documents):
+        if self.cache_dir is not None:
+            autogen_utils.save_file(
+                Path(self.cache_dir) / "search_documents.json",
+                json.dumps(search_documents),
+            )
 
-        md_file = open(src_dir / fname, encoding="utf-8")
-        md_content = md_file.read()
-        md_file.close()
-        md_content = replace_links(md_content)
-
-        # Convert Keras symbols to links to the Keras docs
+    def make_search_index(self, documents):
+        """Write the offline search index (see `search_index`) to the site."""
+        # API symbols, by the URL of the page documenting them.
+        symbols = collections.defaultdict(list)
         for symbol, link in self._symbol_to_link_map.items():
-            md_content = md_content.replace(symbol, link)
-
-        # Convert TF symbols to links to tensorflow.org
-        tmp_content = copy.copy(md_content)
-        replacements = {}
-        while "`tf." in tmp_content:
-            index = tmp_content.find("`tf.")
-            if tmp_content[index - 1] == "[":
-                tmp_content = tmp_content[tmp_content.find("`tf.") + 1 :]
-                tmp_content = tmp_content[tmp_content.find("`") + 1 :]
-            else:
-                tmp_content = tmp_content[tmp_content.find("`tf.") + 1 :]
-                symbol = tmp_content[: tmp_content.find("`")]
-                tmp_content = tmp_content[tmp_content.find("`") + 1 :]
-                if "/" not in symbol and "(" not in symbol:
-                    # Check if we're looking at a method on a class
-                    symbol_parts = symbol.split(".")
-                    if len(symbol_parts) >= 3 and symbol_parts[-2][0].isupper():
-                        # In this case the link should look like ".../class#method"
-                        path = "/".join(symbol_parts[:-1]) + "#" + symbol_parts[-1]
-                    else:
-                        # Otherwise just ".../module/class_or_fn"
-                        path = symbol.replace(".", "/")
-                    path = path.replace("(", "")
-                    path = path.replace(")", "")
-                    replacements["`" + symbol + "`"] = (
-                        "[`"
-                        + symbol
-                        + "`](https://www.tensorflow.org/api_docs/python/"
-                        + path
-                        + ")"
-                    )
-        for key, value in replacements.items():
-            md_content = md_content.replace(key, value)
+            url = link[link.rfind("(") + 1 : -1].split("#")[0]
+            symbols["/" + url.strip("/") + "/"].append(symbol.strip("`"))
+        for document in documents:
+            search_index.add_symbols(document, symbols.get(document["url"], []))
+        search_index.build_index(documents, Path(self.site_dir) / "search_index")
 
-        html_content = autogen_utils.render_markdown_to_html(md_content)
-        html_content = insert_title_ids_in_html(html_content)
-        local_nav = [
-            autogen_utils.set_active_flag_in_nav_entry(entry, relative_url)
-            for entry in nav
-        ]
+    def render_page_task(self, task):
+        page, digest = task
+        print("...Rendering", page.record.fname)
+        return page.record, digest, self.render_page(page)
+
+    def render_page(self, page):
+        """Render a `page_graph.Page` to its HTML file.
+
+        Returns the relative URL and the search document of the page.
+        """
+        record = page.record
+        target_path, relative_url = self.get_target_path_and_url(
+            record.src_location, record.fname
+        )
+        if not os.path.exists(target_path.parent):
+            try:
+                os.makedirs(target_path.parent)
+            except FileExistsError:
+                # Might be created by a concurrent process.
+                pass
+
+        md_content = replace_links(page.md_content)
+
+        # Convert Keras and TF symbols to links to their API docs
+        md_content = self.symbol_linker.link(md_content)
+
+        html_content = autogen_utils.render_markdown_to_html(
+            md_content, insert_title_ids=True
+        )
         title = md_content[2 : md_content.find("\n")]
 
         self.render_single_docs_page_from_html(
             target_path,
             title,
             html_content,
-            metadata["location_history"],
-            metadata["outline"],
-            local_nav,
+            record.location_history,
+            record.outline,
             relative_url,
         )
-        return relative_url
+        search_document = search_index.make_document(
+            relative_url, title, html_content, record.outline
+        )
+        return relative_url, search_document
 
     def render_single_docs_page_from_html(
         self,
@@ -950,11 +1358,10 @@ class KerasIO:
         html_content,
         location_history,
         outline,
-        local_nav,
         relative_url,
     ):
-        base_template = jinja2.Template(open(Path(self.theme_dir) / "base.html").read())
-        docs_template = jinja2.Template(open(Path(self.theme_dir) / "docs.html").read())
+        base_template = self.get_theme_template("base.html")
+        docs_template = self.get_theme_template("docs.html")
         html_docs = docs_template.render(
             {
                 "title": title,
@@ -967,7 +1374,7 @@ class KerasIO:
         html_page = base_template.render(
             {
                 "title": title,
-                "nav": local_nav,
+                "nav_html": self.get_nav_html(relative_url),
                 "base_url": self.url,
                 "main": html_docs,
                 "relative_url": relative_url,
@@ -983,10 +1390,10 @@ class KerasIO:
 
     def serve(self):
         os.chdir(self.site_dir)
+        if os.path.exists(Path("search_index") / "meta.json"):
+            SearchRequestHandler.search_index = search_index.SearchIndex("search_index")
         socketserver.ThreadingTCPServer.allow_reuse_address = True
-        server = socketserver.ThreadingTCPServer(
-            ("", 8000), http.server.SimpleHTTPRequestHandler
-        )
+        server = socketserver.ThreadingTCPServer(("", 8000), SearchRequestHandler)
         server.daemon_threads = True
 
         def signal_handler(signal, frame):
@@ -1006,6 +1413,41 @@ class KerasIO:
             server.server_close()
 
 
+class SearchRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves the site, plus search results at `/api/search?query=...`."""
+
+    search_index = None
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/api/search":
+            return super().do_GET()
+        if self.search_index is None:
+            return self.send_error(404, "No search index, run `make` first.")
+        params = urllib.parse.parse_qs(url.query)
+        results = self.search_index.search(params.get("query", [""])[0])
+        content = json.dumps(results).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+# Per-process state of HTML rendering workers, set once by `init_render_worker`.
+_render_worker_keras_io = None
+
+
+def init_render_worker(keras_io):
+    global _render_worker_keras_io
+    _render_worker_keras_io = keras_io
+
+
+def render_page_in_worker(task):
+    # Pages carry their own record: the graph of the worker may be incomplete.
+    return _render_worker_keras_io.render_page_task(task)
+
+
 def replace_links(content):
     # Make sure all Keras guides point to keras.io.
     for entry in generate_tf_guides.CONFIG:
@@ -1036,41 +1478,6 @@ def copy_inner_contents(src, dst, ext=".md"):
             copy_inner_contents(fpath, fdst, ext)
 
 
-def insert_title_ids_in_html(html):
-    marker = "replace_me_with_id_for:"
-    marker_end = ":end_of_title"
-    for i in range(1, 5):
-        match = "<h" + str(i) + ">(.*?)</h" + str(i) + ">"
-        replace = (
-            "<h"
-            + str(i)
-            + r' id="'
-            + marker
-            + r"\1"
-            + marker_end
-            + r'">\1</h'
-            + str(i)
-            + ">"
-        )
-        html = re.sub(match, replace, html)
-
-    while 1:
-        start = html.find(marker)
-        if start == -1:
-            break
-        title = html[start + len(marker) :]
-        title = title[: title.find(marker_end)]
-        normalized_title = title
-        normalized_title = normalized_title.replace("<code>", "")
-        normalized_title = normalized_title.replace("</code>", "")
-        if ">" in normalized_title:
-            normalized_title = normalized_title[normalized_title.find(">") + 1 :]
-            normalized_title = normalized_title[: normalized_title.find("</")]
-        normalized_title = autogen_utils.turn_title_into_id(normalized_title)
-        html = html.replace(marker + title + marker_end, normalized_title)
-    return html
-
-
 def generate_md_toc(entries, url, depth=2):
     assert url.endswith("/")
     entries = [e for e in entries if not e.get("skip_from_toc")]
@@ -1121,6 +1528,22 @@ def generate_md_toc(entries, url, depth=2):
     return generated
 
 
+def remove_stale_tutobook_outputs(target_dir, img_dir, jobs):
+    """Remove the md files and images of tutobooks that no longer exist."""
+    names = set(Path(job["md_path"]).stem for job in jobs)
+    for fname in os.listdir(target_dir):
+        path = Path(target_dir) / fname
+        # e.g. `guides/md/keras_hub/`, which has its own tutobooks.
+        if not os.path.isfile(path):
+            continue
+        if fname.split(".")[0] not in names:
+            os.remove(path)
+    for fname in os.listdir(img_dir):
+        path = Path(img_dir) / fname
+        if fname not in names and os.path.isdir(path):
+            shutil.rmtree(path)
+
+
 def get_working_dir(arg):
     if not arg.startswith("--working_dir="):
         return None
@@ -1141,6 +1564,9 @@ if __name__ == "__main__":
         redirects_dir=os.path.join(root, "redirects"),
         refresh_guides=False,
         refresh_examples=False,
+        cache_dir=os.path.join(root, ".build_cache"),
+        incremental="--incremental" in sys.argv,
+        resume="--resume" in sys.argv,
     )
     error_msg = (
         "Must specify command " "`make`, `serve`, `add_example`, or `add_guide`."
@@ -1162,8 +1588,13 @@ if __name__ == "__main__":
                 "`autogen.py add_example vision/cats_and_dogs`"
             )
     if cmd == "make":
-        keras_io.make_md_sources()
-        keras_io.render_md_sources_to_html()
+        if "--stream" in sys.argv:
+            keras_io.make_streaming(keep_sources="--keep-sources" in sys.argv)
+        else:
+            keras_io.make_md_sources()
+            keras_io.render_md_sources_to_html()
+        if "--dump-page-graph" in sys.argv:
+            keras_io.page_graph.dump(root / ".build_cache" / "page_graph.jsonl")
     elif cmd == "serve":
         keras_io.serve()
     elif cmd == "add_example":
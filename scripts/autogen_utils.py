@@ -1,6 +1,11 @@
 import re
 import string
 import markdown
+import markdown.extensions.codehilite
+import markdown.postprocessors
+import pygments.formatters
+import pygments.lexers
+import pygments.util
 import copy
 import pathlib
 import os
@@ -32,6 +37,61 @@ def turn_title_into_id(title):
     return title
 
 
+# Matches a heading without attributes, e.g. `<h2>Title</h2>`.
+_HEADING = re.compile(r"<h([1-4])>(.*?)</h\1>")
+
+
+def get_title_id(title_html):
+    """Compute the id of a heading from its inner HTML."""
+    title = title_html.replace("<code>", "")
+    title = title.replace("</code>", "")
+    if ">" in title:
+        # e.g. a title wrapped in a link
+        title = title[title.find(">") + 1 :]
+        title = title[: title.find("</")]
+    return turn_title_into_id(title)
+
+
+def insert_title_ids_in_html(html):
+    """Add an `id` attribute to every h1-h4 heading, in a single pass.
+
+    If several headings map to the same id, the later ones get a numeric
+    suffix (`-1`, `-2`, ...) and the collision is reported.
+    """
+    seen_ids = {}
+
+    def add_id(match):
+        level, title = match.groups()
+        title_id = get_title_id(title)
+        if title_id in seen_ids:
+            seen_ids[title_id] += 1
+            unique_id = f"{title_id}-{seen_ids[title_id]}"
+            while unique_id in seen_ids:
+                seen_ids[title_id] += 1
+                unique_id = f"{title_id}-{seen_ids[title_id]}"
+            print(f"...Duplicate title id `{title_id}`, using `{unique_id}`")
+            seen_ids[unique_id] = 0
+            title_id = unique_id
+        else:
+            seen_ids[title_id] = 0
+        return f'<h{level} id="{title_id}">{title}</h{level}>'
+
+    return _HEADING.sub(add_id, html)
+
+
+class TitleIdPostprocessor(markdown.postprocessors.Postprocessor):
+    def run(self, text):
+        return insert_title_ids_in_html(text)
+
+
+class TitleIdExtension(markdown.Extension):
+    """Markdown extension adding ids to the headings of the rendered HTML."""
+
+    def extendMarkdown(self, md):
+        # Run last, once raw HTML and smarty substitutions are resolved.
+        md.postprocessors.register(TitleIdPostprocessor(md), "title_ids", 0)
+
+
 def make_outline(md_source):
     lines = md_source.split("\n")
     outline = []
@@ -74,19 +134,60 @@ def make_outline(md_source):
     return outline
 
 
-def render_markdown_to_html(md_content):
-    return markdown.markdown(
-        md_content,
-        extensions=[
-            "fenced_code",
-            "tables",
-            "codehilite",
-            "mdx_truly_sane_lists",
-            "smarty",
-        ],
+# Reuse Markdown converters and Pygments lexers/formatters across pages.
+USE_RENDER_CACHE = True
+# Markdown converters of this process, keyed by `insert_title_ids`.
+_markdown_converters = {}
+# Pygments lexers and formatters of this process, keyed by name and options.
+_pygments_cache = {}
+
+
+def get_pygments_object(factory, name, **options):
+    """Cached version of Pygments' `get_lexer_by_name` & co."""
+    if not USE_RENDER_CACHE:
+        return factory(name, **options)
+    key = (factory.__name__, name, repr(sorted(options.items())))
+    if key not in _pygments_cache:
+        try:
+            _pygments_cache[key] = factory(name, **options)
+        except pygments.util.ClassNotFound:
+            _pygments_cache[key] = None
+    if _pygments_cache[key] is None:
+        raise pygments.util.ClassNotFound(f"Not found: {name}")
+    return _pygments_cache[key]
+
+
+def get_cached_lexer_by_name(name, **options):
+    return get_pygments_object(pygments.lexers.get_lexer_by_name, name, **options)
+
+
+def get_cached_html_formatter(lang_str=None, **options):
+    # `lang_str` is ignored, as it is by codehilite's default "html" formatter.
+    return get_pygments_object(
+        pygments.formatters.get_formatter_by_name, "html", **options
+    )
+
+
+# codehilite looks up a lexer for every code block; this is the only hook.
+markdown.extensions.codehilite.get_lexer_by_name = get_cached_lexer_by_name
+
+
+def make_markdown_converter(insert_title_ids=False):
+    extensions = [
+        "fenced_code",
+        "tables",
+        "codehilite",
+        "mdx_truly_sane_lists",
+        "smarty",
+    ]
+    if insert_title_ids:
+        extensions.append(TitleIdExtension())
+    return markdown.Markdown(
+        extensions=extensions,
         extension_configs={
             "codehilite": {
                 "guess_lang": False,
+                "pygments_formatter": get_cached_html_formatter,
             },
             "smarty": {
                 "smart_dashes": True,
@@ -98,6 +199,17 @@ def render_markdown_to_html(md_content):
     )
 
 
+def render_markdown_to_html(md_content, insert_title_ids=False):
+    if not USE_RENDER_CACHE:
+        return make_markdown_converter(insert_title_ids).convert(md_content)
+    converter = _markdown_converters.get(insert_title_ids)
+    if converter is None:
+        converter = make_markdown_converter(insert_title_ids)
+        _markdown_converters[insert_title_ids] = converter
+    converter.reset()
+    return converter.convert(md_content)
+
+
 def set_active_flag_in_nav_entry(entry, relative_url):
     entry = copy.copy(entry)
     if relative_url.startswith(entry["relative_url"]):
@@ -0,0 +1,70 @@
+"""Micro-benchmark of `autogen_utils.render_markdown_to_html`.
+
+Renders every page of the `sources/` tree, first with a fresh Markdown
+converter and fresh Pygments lexers/formatters for each page (the old
+behavior), then with the per-process caches, and reports the per-page cost.
+
+USAGE:
+
+python autogen.py make  # Populates sources/
+python bench_markdown.py [sources_dir]
+"""
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import autogen_utils
+
+
+def load_pages(sources_dir):
+    pages = []
+    for src_location, _, fnames in os.walk(sources_dir):
+        for fname in sorted(fnames):
+            if fname.endswith(".md"):
+                with open(Path(src_location) / fname, encoding="utf-8") as f:
+                    pages.append(f.read())
+    return pages
+
+
+def time_pages(pages, use_cache):
+    autogen_utils.USE_RENDER_CACHE = use_cache
+    autogen_utils._markdown_converters.clear()
+    autogen_utils._pygments_cache.clear()
+    timings = []
+    outputs = []
+    for md_content in pages:
+        start = time.perf_counter()
+        outputs.append(
+            autogen_utils.render_markdown_to_html(md_content, insert_title_ids=True)
+        )
+        timings.append(time.perf_counter() - start)
+    return timings, outputs
+
+
+def report(name, timings):
+    print(
+        f"{name:>8}: total {sum(timings):.2f}s, "
+        f"mean {1000 * statistics.mean(timings):.2f}ms/page, "
+        f"median {1000 * statistics.median(timings):.2f}ms/page"
+    )
+
+
+if __name__ == "__main__":
+    root = Path(__file__).parent.parent.resolve()
+    sources_dir = sys.argv[1] if len(sys.argv) > 1 else root / "sources"
+    pages = load_pages(sources_dir)
+    if not pages:
+        raise ValueError(
+            f"No md sources found in {sources_dir}. Run `python autogen.py make` first."
+        )
+    print(f"Rendering {len(pages)} pages from {sources_dir}")
+    before, expected = time_pages(pages, use_cache=False)
+    after, outputs = time_pages(pages, use_cache=True)
+    if outputs != expected:
+        raise RuntimeError("Cached rendering produced different HTML.")
+    report("uncached", before)
+    report("cached", after)
+    print(f"Speedup: {sum(before) / sum(after):.2f}x")
@@ -0,0 +1,106 @@
+"""Content-addressed build manifest for incremental `autogen.py make` runs.
+
+The manifest maps a page key (e.g. `api/layers/core_layers/dense.md`) to the
+digest of every input that went into producing that page, along with the
+output files that were written for it. On the next build, a page whose
+digest is unchanged (and whose outputs are still on disk) can be skipped.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import autogen_utils
+
+MANIFEST_VERSION = 1
+
+
+def hash_content(*parts):
+    """Hash an arbitrary sequence of strings, bytes or JSON-able objects."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        h.update(data)
+        # Separator so that ("ab", "c") and ("a", "bc") don't collide.
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def hash_files(paths):
+    """Hash the contents of a list of files and/or directories."""
+    h = hashlib.sha256()
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            fpaths = sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            fpaths = [path]
+        for fpath in fpaths:
+            h.update(str(fpath.name).encode("utf-8"))
+            h.update(b"\0")
+            with open(fpath, "rb") as f:
+                h.update(f.read())
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+class BuildManifest:
+    def __init__(self, path=None):
+        """If `path` is None, the manifest is only kept in memory."""
+        self.path = path
+        self.entries = self.load()
+        self.seen = set()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf8") as f:
+            try:
+                content = json.loads(f.read())
+            except json.JSONDecodeError:
+                print("Ignoring corrupted build manifest", self.path)
+                return {}
+        if content.get("version") != MANIFEST_VERSION:
+            return {}
+        return content["entries"]
+
+    def save(self):
+        if self.path is None:
+            return
+        content = {"version": MANIFEST_VERSION, "entries": self.entries}
+        autogen_utils.save_file(self.path, json.dumps(content, indent=1))
+
+    def is_fresh(self, key, digest):
+        """Whether `key` was already built from inputs matching `digest`."""
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None or entry["digest"] != digest:
+            return False
+        return all(os.path.exists(p) for p in entry["outputs"])
+
+    def record(self, key, digest, outputs):
+        self.seen.add(key)
+        self.entries[key] = {
+            "digest": digest,
+            "outputs": [str(p) for p in outputs],
+        }
+
+    def remove_stale(self):
+        """Delete outputs of pages that were not seen during this build.
+
+        Returns the list of stale keys.
+        """
+        stale = sorted(key for key in self.entries if key not in self.seen)
+        for key in stale:
+            for output in self.entries[key]["outputs"]:
+                if os.path.exists(output):
+                    print("...Removing stale", output)
+                    os.remove(output)
+            del self.entries[key]
+        return stale
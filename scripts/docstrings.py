@@ -8,13 +8,30 @@ import inspect
 import importlib
 import itertools
 import copy
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
 
 import render_presets
 
+# Bump to invalidate all cached docstring blocks.
+RENDER_CACHE_VERSION = 1
+
 
 class KerasDocumentationGenerator:
-    def __init__(self, project_url=None):
+    def __init__(self, project_url=None, cache_dir=None):
+        """If `cache_dir` is set, rendered blocks are cached there on disk."""
         self.project_url = project_url
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            # Any change to the rendering code invalidates the cache.
+            h = hashlib.sha256(str(RENDER_CACHE_VERSION).encode("utf-8"))
+            for module in (sys.modules[__name__], render_presets):
+                with open(module.__file__, "rb") as f:
+                    h.update(f.read())
+            self.code_version = h.hexdigest()
 
     def process_docstring(self, docstring):
         docstring = docstring.replace("Args:", "# Arguments")
@@ -69,6 +86,50 @@ class KerasDocumentationGenerator:
         return signature
 
     def render(self, element):
+        if self.cache_dir is None or not isinstance(element, str):
+            return self.render_uncached(element)
+        cache_path = Path(self.cache_dir) / (self.get_cache_key(element) + ".md")
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding="utf8") as f:
+                return f.read()
+        rendered = self.render_uncached(element)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write atomically so an interrupted build can't leave partial blocks.
+        tmp_path = str(cache_path) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            f.write(rendered)
+        os.replace(tmp_path, cache_path)
+        return rendered
+
+    def get_cache_key(self, element):
+        """Key of the rendered block of `element` in the on-disk cache.
+
+        It covers the installed version of the library the symbol comes from,
+        the file defining the symbol (for editable installs) and the version
+        of the rendering code, but requires no introspection beyond an import.
+        """
+        object_ = import_object(element)
+        base_module = importlib.import_module(element.split(".")[0])
+        if hasattr(object_, "fget"):
+            module_name = object_.fget.__module__
+        else:
+            module_name = getattr(object_, "__module__", None)
+        source_file = getattr(sys.modules.get(module_name), "__file__", None)
+        source_stat = None
+        if source_file is not None and os.path.exists(source_file):
+            stat = os.stat(source_file)
+            source_stat = [stat.st_mtime_ns, stat.st_size]
+        key = [
+            element,
+            getattr(base_module, "__version__", None),
+            source_file,
+            source_stat,
+            self.code_version,
+            self.project_url,
+        ]
+        return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+    def render_uncached(self, element):
         if isinstance(element, str):
             object_ = import_object(element)
             if ismethod(object_):
@@ -103,28 +164,95 @@ class KerasDocumentationGenerator:
         return "\n\n".join(subblocks) + "\n\n----\n\n"
 
 
+def get_fingerprint(element):
+    """Summarize everything `render(element)` depends on, cheaply.
+
+    This skips the expensive parts of rendering (black, docstring
+    processing) and is used to detect API pages that need regenerating.
+    """
+    if isinstance(element, str):
+        object_ = import_object(element)
+    else:
+        object_ = element
+    parts = [str(element), getattr(object_, "__module__", None)]
+    parts.append(inspect.getdoc(object_))
+    if inspect.isclass(object_):
+        function = object_.__init__
+    elif hasattr(object_, "fget"):
+        function = object_.fget
+    else:
+        function = object_
+    try:
+        parts.append(str(inspect.signature(function)))
+    except (TypeError, ValueError):
+        parts.append(None)
+    try:
+        parts.append(get_source_line(object_))
+    except (OSError, TypeError):
+        parts.append(None)
+    if hasattr(object_, "__module__"):
+        base_module = importlib.import_module(object_.__module__.split(".")[0])
+        parts.append(getattr(base_module, "__version__", None))
+    return "\n".join(str(part) for part in parts)
+
+
 def ismethod(function):
     return get_class_from_method(function) is not None
 
 
+# Process-wide caches, so each symbol is resolved and introspected only once
+# per build even though it is looked up by several build steps.
+_imported_objects = {}
+# Dotted paths known not to be importable modules (e.g. `keras.layers.Dense`).
+_missing_modules = set()
+# Introspection results per object, keyed by `id()` since documented objects
+# aren't always hashable. Each entry keeps a reference to its object so that
+# the id can't be recycled.
+_object_metadata = {}
+
+
 def import_object(string: str):
     """Import an object from a string.
 
     The object can be a function, class or method.
     For example: `'keras.layers.Dense.get_weights'` is valid.
     """
+    if string in _imported_objects:
+        return _imported_objects[string]
     last_object_got = None
     seen_names = []
     for name in string.split("."):
         seen_names.append(name)
-        try:
-            last_object_got = importlib.import_module(".".join(seen_names))
-        except ModuleNotFoundError:
-            assert last_object_got is not None, f"Failed to import path {string}"
-            last_object_got = getattr(last_object_got, name)
+        module_name = ".".join(seen_names)
+        if module_name not in _missing_modules:
+            try:
+                last_object_got = importlib.import_module(module_name)
+                continue
+            except ModuleNotFoundError:
+                _missing_modules.add(module_name)
+        assert last_object_got is not None, f"Failed to import path {string}"
+        last_object_got = getattr(last_object_got, name)
+    _imported_objects[string] = last_object_got
     return last_object_got
 
 
+def get_cached_metadata(object_, key, compute):
+    """Return `compute(object_)`, computing it at most once per object."""
+    entry = _object_metadata.get(id(object_))
+    if entry is None:
+        entry = _object_metadata[id(object_)] = (object_, {})
+    metadata = entry[1]
+    if key not in metadata:
+        metadata[key] = compute(object_)
+    return metadata[key]
+
+
+def get_source_line(object_):
+    return get_cached_metadata(
+        object_, "source_line", lambda x: inspect.getsourcelines(x)[-1]
+    )
+
+
 def make_source_link(cls, project_url):
     if not hasattr(cls, "__module__"):
         return None
@@ -147,7 +275,7 @@ def make_source_link(cls, project_url):
     path = cls.__module__.replace(".", "/")
     if base_module in ("tf_keras",):
         path = path.replace("/src/", "/")
-    line = inspect.getsourcelines(cls)[-1]
+    line = get_source_line(cls)
     return (
         f'<span style="float:right;">'
         f"[[source]]({project_url}{path}.py#L{line})"
@@ -160,6 +288,10 @@ def code_snippet(snippet):
 
 
 def get_type(object_) -> str:
+    return get_cached_metadata(object_, "type", _get_type)
+
+
+def _get_type(object_) -> str:
     if inspect.isclass(object_):
         return "class"
     elif ismethod(object_):
@@ -236,6 +368,12 @@ def get_class_signature(cls, override=None):
 
 
 def get_signature(object_, override):
+    return get_cached_metadata(
+        object_, ("signature", override), lambda x: _get_signature(x, override)
+    )
+
+
+def _get_signature(object_, override):
     if inspect.isclass(object_):
         return get_class_signature(object_, override)
     elif inspect.isfunction(object_) or inspect.ismethod(object_):
@@ -0,0 +1,146 @@
+"""Content-addressed store for the images generated by tutobooks.
+
+Every image is stored once, as `<root>/<digest>.<ext>`, where `digest` is
+the hash of the stored image bytes. PNGs are losslessly optimized when
+they are added, and WebP/AVIF variants (`<digest>.webp`, ...) can be
+generated next to them.
+
+Images are then hard-linked (or copied, across file systems) from the
+store to `examples/*/img/`, `guides/img/` and `site/img/`, so identical
+images only take space once. Since hashed file names never change content,
+they can be cached forever by the CDN.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_STORE_DIR = Path(__file__).parent.parent / ".build_cache" / "media"
+DIGEST_LENGTH = 20
+# Pillow format names of the optional variants.
+VARIANT_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+
+
+def link_or_copy(src, dst):
+    """Hard-link `src` to `dst`, or copy it if hard links aren't possible."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def optimize_png(data):
+    """Re-encode a PNG with `optimize=True`, if that is smaller and lossless."""
+    if Image is None:
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+    except (OSError, ValueError):
+        return data
+    optimized = buffer.getvalue()
+    if len(optimized) >= len(data):
+        return data
+    # Make sure that the pixels are unchanged.
+    reloaded = Image.open(io.BytesIO(optimized))
+    if reloaded.mode != image.mode or reloaded.tobytes() != image.tobytes():
+        return data
+    return optimized
+
+
+def get_digest(data):
+    return hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+
+
+class MediaStore:
+    def __init__(self, root=DEFAULT_STORE_DIR, optimize=True, variants=()):
+        for variant in variants:
+            if variant not in VARIANT_FORMATS:
+                raise ValueError(
+                    f"Unknown image variant: {variant}. "
+                    f"Expected one of: {list(VARIANT_FORMATS)}"
+                )
+        self.root = Path(root)
+        self.optimize = optimize
+        self.variants = variants
+
+    def add(self, data, ext):
+        """Store image bytes. Returns the hashed file name, e.g. `1f3e...png`.
+
+        Blobs are named by the hash of the stored (optimized) bytes, so adding
+        an image that is already in the store returns its existing blob.
+        """
+        digest = get_digest(data)
+        blob_path = self.root / f"{digest}.{ext}"
+        if not os.path.exists(blob_path):
+            if self.optimize and ext == "png":
+                data = optimize_png(data)
+                digest = get_digest(data)
+                blob_path = self.root / f"{digest}.{ext}"
+            if not os.path.exists(blob_path):
+                os.makedirs(self.root, exist_ok=True)
+                self.write(blob_path, data)
+        for variant in self.variants:
+            variant_path = self.root / f"{digest}.{variant}"
+            if not os.path.exists(variant_path):
+                self.make_variant(blob_path, variant_path, VARIANT_FORMATS[variant])
+        return blob_path.name
+
+    def add_file(self, path):
+        with open(path, "rb") as f:
+            return self.add(f.read(), Path(path).suffix[1:])
+
+    def write(self, path, data):
+        # Write atomically, since several processes may add the same image.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def make_variant(self, blob_path, variant_path, image_format):
+        if Image is None:
+            return
+        buffer = io.BytesIO()
+        try:
+            Image.open(blob_path).save(buffer, format=image_format, lossless=True)
+        except (KeyError, OSError, ValueError) as e:
+            print(f"Could not save {blob_path} as {image_format}: {e}")
+            return
+        self.write(variant_path, buffer.getvalue())
+
+    def link(self, fname, target_dir, target_fname=None):
+        """Link a stored image (and its variants) into `target_dir`."""
+        os.makedirs(target_dir, exist_ok=True)
+        target_fname = target_fname or fname
+        link_or_copy(self.root / fname, Path(target_dir) / target_fname)
+        stem = Path(fname).stem
+        target_stem = Path(target_fname).stem
+        for variant in self.variants:
+            variant_path = self.root / f"{stem}.{variant}"
+            if os.path.exists(variant_path):
+                link_or_copy(
+                    variant_path, Path(target_dir) / f"{target_stem}.{variant}"
+                )
+
+    def sync_dir(self, src_dir, target_dir):
+        """Add all images of `src_dir` to the store, and link them (under their
+        current names) into `target_dir`."""
+        for fname in sorted(os.listdir(src_dir)):
+            path = Path(src_dir) / fname
+            if os.path.isdir(path):
+                self.sync_dir(path, Path(target_dir) / fname)
+            elif fname.endswith(("png", "jpg", "jpeg", "gif")):
+                self.link(self.add_file(path), target_dir, target_fname=fname)
+            elif not fname.endswith(tuple(VARIANT_FORMATS)):
+                os.makedirs(target_dir, exist_ok=True)
+                shutil.copyfile(path, Path(target_dir) / fname)
@@ -0,0 +1,63 @@
+"""Pre-rendered sidebar navigation, shared by all pages of the site.
+
+The sidebar (`theme/nav.html`) only depends on which of its visible entries
+are active: the top-level entries whose URL prefixes the page URL, their
+active children and their active grandchildren. There are only a few
+hundred distinct such sets across the site, so the sidebar is rendered once
+per set and looked up by page URL, instead of copying the nav tree to flag
+its active entries and rendering it again for every page.
+"""
+
+import autogen_utils
+
+# Levels of the nav tree rendered by `theme/nav.html`.
+NAV_DEPTH = 3
+
+
+class NavCache:
+    def __init__(self, nav):
+        self.nav = nav
+        # Maps a tuple of active entry URLs to the rendered sidebar.
+        self._fragments = {}
+
+    def get_active_urls(self, relative_url):
+        """URLs of the visible nav entries that are active for a page."""
+        active_urls = []
+        entries = self.nav
+        for _ in range(NAV_DEPTH):
+            active_entries = [
+                entry
+                for entry in entries
+                if relative_url is not None
+                and relative_url.startswith(entry["relative_url"])
+            ]
+            active_urls += [entry["relative_url"] for entry in active_entries]
+            # Only the children of active entries are rendered.
+            entries = [child for entry in active_entries for child in entry["children"]]
+        return tuple(active_urls)
+
+    def get(self, relative_url, template):
+        """Sidebar HTML of the page at `relative_url` (None for no page)."""
+        key = self.get_active_urls(relative_url)
+        if key not in self._fragments:
+            if relative_url is None:
+                nav = self.nav
+            else:
+                nav = [
+                    autogen_utils.set_active_flag_in_nav_entry(entry, relative_url)
+                    for entry in self.nav
+                ]
+            self._fragments[key] = template.render({"nav": nav})
+        return self._fragments[key]
+
+    def prerender(self, template):
+        """Render the sidebar of every nav entry, e.g. before forking workers."""
+
+        def visit(entries, depth):
+            for entry in entries:
+                self.get(entry["relative_url"], template)
+                if depth < NAV_DEPTH:
+                    visit(entry["children"], depth + 1)
+
+        visit(self.nav, 1)
+        return len(self._fragments)
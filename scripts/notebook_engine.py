@@ -0,0 +1,353 @@
+"""In-process execution of tutobook notebooks.
+
+Notebooks are executed with `nbclient` on a pool of warm Jupyter kernels
+instead of one `jupyter nbconvert --execute` process per notebook. A kernel
+is reused across notebooks, so the Python interpreter and the frameworks
+imported by previous notebooks (TensorFlow, JAX, torch...) are already
+loaded. Before each notebook, the user namespace of the kernel is reset and
+its working directory is switched to the notebook's one.
+
+Kernels are keyed by Keras backend (set through `KERAS_BACKEND` in the
+kernel environment), since the backend can't be changed once Keras has been
+imported. A kernel is discarded after a timeout or a crash, and after
+`max_uses` notebooks.
+
+Markdown export happens in memory with `nbconvert.MarkdownExporter`.
+"""
+
+import ast
+import multiprocessing.util
+import os
+import re
+import time
+from pathlib import Path
+
+import nbformat
+from jupyter_client.manager import AsyncKernelManager
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError
+from nbclient.exceptions import CellTimeoutError
+from nbclient.exceptions import DeadKernelError
+from nbclient.util import run_sync
+from nbconvert import MarkdownExporter
+from nbconvert.preprocessors import ExtractOutputPreprocessor
+from traitlets.config import Config
+
+TIMEOUT = 12 * 60 * 60  # 12 hours, per cell
+STARTUP_TIMEOUT = 120
+DEFAULT_MAX_USES = 20
+DEFAULT_BACKEND = "tensorflow"
+IMG_EXTS = ("png", "jpg", "jpeg")
+
+_KERAS_BACKEND = re.compile(
+    r"""os\.environ\[["']KERAS_BACKEND["']\]\s*=\s*["'](\w+)["']"""
+)
+
+# Run in the kernel before each notebook.
+# The previous working directory may be gone, so switch first.
+_RESET_TEMPLATE = """\
+import os as _os
+_os.chdir({working_dir!r})
+get_ipython().run_line_magic("reset", "-f")
+import sys as _sys
+if "keras" in _sys.modules:
+    try:
+        _sys.modules["keras"].utils.clear_session()
+        _sys.modules["keras"].config.set_dtype_policy("float32")
+    except AttributeError:  # Older Keras versions.
+        pass
+del _sys
+
+
+def _tutobook_usage():
+    # CPU time of the kernel and its subprocesses, and peak RSS of the
+    # kernel since the previous call (as bytes).
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+    peak_rss = usage.ru_maxrss * 1024
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_rss = int(line.split()[1]) * 1024
+        # Reset the peak RSS, so that it is measured per cell (Linux only).
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return cpu_time, peak_rss
+"""
+
+
+class NotebookExecutionError(RuntimeError):
+    """Raised when a cell of a notebook fails or times out."""
+
+    def __init__(self, name, cell_index, source, ename, evalue, traceback=""):
+        self.name = name
+        self.cell_index = cell_index
+        self.source = source
+        self.ename = ename
+        self.evalue = evalue
+        self.traceback = traceback
+        if cell_index is None:
+            location = "before the first cell"
+        else:
+            location = f"cell {cell_index}"
+        super().__init__(
+            f"Error in notebook {name}, {location}: {ename}: {evalue}\n"
+            f"Cell source:\n{source}"
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "cell_index": self.cell_index,
+            "source": self.source,
+            "ename": self.ename,
+            "evalue": self.evalue,
+            "traceback": self.traceback,
+        }
+
+
+def get_keras_backend(nb):
+    """Return the Keras backend set by the notebook (or the default one)."""
+    for cell in nb.cells:
+        if cell.cell_type == "code":
+            match = _KERAS_BACKEND.search(cell.source)
+            if match:
+                return match.group(1)
+    return os.environ.get("KERAS_BACKEND", DEFAULT_BACKEND)
+
+
+class KernelPool:
+    """Warm Jupyter kernels, reused across notebooks of the same backend."""
+
+    def __init__(self, max_uses=DEFAULT_MAX_USES, kernel_name="python3"):
+        self.max_uses = max_uses
+        self.kernel_name = kernel_name
+        # Maps (backend, variant) to a list of (kernel manager, uses).
+        self._idle = {}
+
+    def start_kernel(self, backend):
+        print(f"Starting {backend} kernel")
+        km = AsyncKernelManager(kernel_name=self.kernel_name)
+        env = dict(os.environ)
+        env["KERAS_BACKEND"] = backend
+        run_sync(km.start_kernel)(env=env)
+        return km
+
+    def acquire(self, backend, variant=None):
+        """Return an idle kernel for `backend` and its use count.
+
+        Kernels of different `variant`s (e.g. with a prelude patching
+        libraries) are never shared.
+        """
+        idle = self._idle.setdefault((backend, variant), [])
+        while idle:
+            km, uses = idle.pop()
+            if run_sync(km.is_alive)():
+                return km, uses
+            self.shutdown_kernel(km)
+        return self.start_kernel(backend), 0
+
+    def release(self, km, backend, uses, healthy=True, variant=None):
+        if healthy and uses < self.max_uses:
+            self._idle.setdefault((backend, variant), []).append((km, uses))
+        else:
+            self.shutdown_kernel(km)
+
+    def shutdown_kernel(self, km):
+        try:
+            run_sync(km.shutdown_kernel)(now=True)
+        except RuntimeError:
+            pass
+        run_sync(km.cleanup_resources)()
+
+    def shutdown(self):
+        for kernels in self._idle.values():
+            for km, _ in kernels:
+                self.shutdown_kernel(km)
+        self._idle = {}
+
+
+_default_pool = None
+
+
+def get_default_pool():
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = KernelPool()
+        # Unlike `atexit` handlers, this also runs when a `multiprocessing`
+        # worker process exits normally (after `Pool.close()`).
+        multiprocessing.util.Finalize(
+            _default_pool, _default_pool.shutdown, exitpriority=0
+        )
+    return _default_pool
+
+
+def execute_notebook(
+    nb, working_dir, name="notebook", timeout=TIMEOUT, pool=None, prelude=None
+):
+    """Execute `nb` (a `NotebookNode`) in place, in `working_dir`.
+
+    Cells run one by one with a timeout of `timeout` seconds each. The first
+    failing cell raises a `NotebookExecutionError`. `prelude` is optional
+    code run silently in the kernel before the first cell.
+
+    Returns a list with the profile of each code cell: its `index`, its
+    `wall_time` and `cpu_time` (in seconds) and the `peak_rss` (in bytes)
+    of the kernel while it ran.
+    """
+    if pool is None:
+        pool = get_default_pool()
+    working_dir = os.path.abspath(working_dir)
+    backend = get_keras_backend(nb)
+    km, uses = pool.acquire(backend, variant=prelude)
+    client = NotebookClient(
+        nb,
+        km=km,
+        timeout=timeout,
+        startup_timeout=STARTUP_TIMEOUT,
+        resources={"metadata": {"path": working_dir}},
+    )
+    client.reset_execution_trackers()
+    healthy = False
+    try:
+        with client.setup_kernel(cleanup_kc=False):
+            reset_code = _RESET_TEMPLATE.format(working_dir=working_dir)
+            for code in (reset_code, prelude):
+                if code is None:
+                    continue
+                msg_id = client.kc.execute(code, silent=True, store_history=False)
+                reply = client.wait_for_reply(msg_id)
+                if reply is None or reply["content"]["status"] != "ok":
+                    raise RuntimeError(f"Could not set up the kernel for {name}.")
+            profile = []
+            # The kernel can die before the first cell runs.
+            index = None
+            source = ""
+            try:
+                cpu_time, _ = get_kernel_usage(client)
+                for index, cell in enumerate(nb.cells):
+                    if cell.cell_type != "code":
+                        continue
+                    source = cell.source
+                    start = time.perf_counter()
+                    client.execute_cell(cell, index)
+                    wall_time = time.perf_counter() - start
+                    previous_cpu_time = cpu_time
+                    cpu_time, peak_rss = get_kernel_usage(client)
+                    profile.append(
+                        {
+                            "index": index,
+                            "wall_time": wall_time,
+                            "cpu_time": cpu_time - previous_cpu_time,
+                            "peak_rss": peak_rss,
+                        }
+                    )
+                healthy = True
+            except CellExecutionError as e:
+                # The kernel itself is fine, only the notebook failed.
+                healthy = True
+                raise NotebookExecutionError(
+                    name, index, source, e.ename, e.evalue, e.traceback
+                ) from None
+            except CellTimeoutError as e:
+                raise NotebookExecutionError(
+                    name, index, source, "CellTimeoutError", str(e)
+                ) from None
+            except DeadKernelError as e:
+                raise NotebookExecutionError(
+                    name, index, source, "DeadKernelError", str(e)
+                ) from None
+    finally:
+        if client.kc is not None:
+            client.kc.stop_channels()
+        pool.release(km, backend, uses + 1, healthy=healthy, variant=prelude)
+    return profile
+
+
+def get_kernel_usage(client):
+    """Return the CPU time and peak RSS of the kernel (see `_RESET_TEMPLATE`)."""
+    msg_id = client.kc.execute(
+        "",
+        silent=True,
+        store_history=False,
+        user_expressions={"usage": "_tutobook_usage()"},
+    )
+    reply = client.wait_for_reply(msg_id)
+    result = reply["content"]["user_expressions"]["usage"]
+    if result["status"] != "ok":
+        return 0.0, None
+    return ast.literal_eval(result["data"]["text/plain"])
+
+
+class ImageWriter(ExtractOutputPreprocessor):
+    """Writes image outputs straight to `resources["img_dir"]`.
+
+    Outputs are decoded from their base64 payloads and written cell by cell,
+    instead of being accumulated in `resources["outputs"]`. With a
+    `resources["media_store"]`, images are added to the store, linked into
+    the image directory and referenced by their hashed names.
+    """
+
+    def preprocess_cell(self, cell, resources, cell_index):
+        resources["outputs"] = {}
+        cell, resources = super().preprocess_cell(cell, resources, cell_index)
+        img_dir = Path(resources["img_dir"])
+        store = resources.get("media_store")
+        renamed = {}
+        for filename, data in resources["outputs"].items():
+            if not filename.endswith(IMG_EXTS):
+                continue
+            if store is None:
+                with open(img_dir / os.path.basename(filename), "wb") as f:
+                    f.write(data)
+            else:
+                stored_fname = store.add(data, filename.rsplit(".", 1)[-1])
+                store.link(stored_fname, img_dir)
+                renamed[filename] = os.path.join(
+                    os.path.dirname(filename), stored_fname
+                )
+        for output in cell.get("outputs", []):
+            filenames = output.get("metadata", {}).get("filenames", {})
+            for mime_type, filename in filenames.items():
+                filenames[mime_type] = renamed.get(filename, filename)
+        resources["outputs"] = {}
+        return cell, resources
+
+
+def export_markdown(nb, name, img_dir, media_store=None):
+    """Convert an executed notebook to markdown, in memory.
+
+    Image outputs are written to `img_dir` and referenced in the markdown as
+    "{name}_files/{name}_3_0.png" (or "{name}_files/<hash>.png" when using
+    a `media_store.MediaStore`). Never changes the current directory, so
+    conversions can run concurrently in threads.
+    """
+    exporter = MarkdownExporter(
+        config=Config({"ExtractOutputPreprocessor": {"enabled": False}})
+    )
+    exporter.register_preprocessor(ImageWriter(), enabled=True)
+    os.makedirs(img_dir, exist_ok=True)
+    md_content, _ = exporter.from_notebook_node(
+        nb,
+        resources={
+            "unique_key": name,
+            "output_files_dir": name + "_files",
+            "img_dir": str(img_dir),
+            "media_store": media_store,
+        },
+    )
+    return md_content
+
+
+def read_notebook(nb_path):
+    return nbformat.read(str(nb_path), as_version=4)
+
+
+def write_notebook(nb, nb_path):
+    nbformat.write(nb, str(nb_path))
@@ -0,0 +1,87 @@
+"""In-memory graph of the pages of the site.
+
+`make_md_sources` records one `PageRecord` per page of the MASTER tree
+(title, URL, breadcrumbs, outline, parent page), and the HTML rendering
+step reads them from memory instead of from per-page `_metadata.json` files.
+Render workers receive the graph once, through the pool initializer.
+
+`KerasIO.iter_md_pages` yields each page as a `Page` (its record and md content)
+as soon as it is generated. `python autogen.py make --stream` renders these
+pages directly, without writing the md sources to disk.
+
+The graph can be dumped as a JSON lines file (one record per line) for
+debugging: `python autogen.py make --dump-page-graph`.
+"""
+
+import json
+
+import autogen_utils
+
+
+class PageRecord:
+    __slots__ = (
+        "page_key",  # e.g. `api/layers/core_layers/dense.md`
+        "src_location",  # Directory of the md source
+        "fname",  # File name of the md source
+        "url",
+        "location",
+        "title",
+        "location_history",  # Breadcrumbs, as `{"url", "title"}` dicts
+        "outline",  # See `autogen_utils.make_outline`
+        "parent",  # Page key of the parent page, or None
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Page:
+    """A generated page: its `PageRecord` and its md content."""
+
+    __slots__ = ("record", "md_content")
+
+    def __init__(self, record, md_content):
+        self.record = record
+        self.md_content = md_content
+
+
+class PageGraph:
+    def __init__(self):
+        self.pages = {}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __contains__(self, page_key):
+        return page_key in self.pages
+
+    def __getitem__(self, page_key):
+        return self.pages[page_key]
+
+    def add(self, record):
+        self.pages[record.page_key] = record
+
+    def records(self):
+        """All records, sorted by page key."""
+        return [self.pages[page_key] for page_key in sorted(self.pages)]
+
+    def get_children(self, page_key):
+        return [record for record in self.records() if record.parent == page_key]
+
+    def dump(self, path):
+        lines = [json.dumps(record.to_dict()) for record in self.records()]
+        autogen_utils.save_file(path, "\n".join(lines) + "\n")
+        print(f"Saved {len(lines)} page records to {path}")
+
+    @classmethod
+    def load(cls, path):
+        graph = cls()
+        with open(path, encoding="utf8") as f:
+            for line in f:
+                if line.strip():
+                    graph.add(PageRecord(**json.loads(line)))
+        return graph
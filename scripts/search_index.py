@@ -0,0 +1,234 @@
+"""Offline full-text search index of keras.io, generated at build time.
+
+`autogen.py make` turns every rendered page into a search document: the
+term frequencies of its title, headings (from `make_outline`) and text,
+plus the API symbols documented on it. The index is then written to
+`site/search_index/` as small static JSON files:
+
+- `meta.json`: index parameters (shared with the search page).
+- `docs.json`: the `[url, title]` of each document, by document id.
+- `shards/<xy>.json`: the postings of all terms starting with `xy`, as
+  `{term: [doc_id, score, doc_id, score, ...]}`. Scores are BM25 weights
+  computed at build time (times 100, rounded), so a query only has to add
+  them up.
+
+A query loads the shards of its terms (once), so its latency doesn't depend
+on the size of the site. The last term of a query also matches as a prefix,
+to search as you type. `theme/search.html` implements the same query logic
+in JavaScript; `SearchIndex` is the Python version, used by
+`autogen.py serve` (`/api/search?query=...`).
+"""
+
+import bisect
+import collections
+import html.parser
+import json
+import math
+import os
+import re
+from pathlib import Path
+
+import autogen_utils
+
+INDEX_VERSION = 1
+# Terms are split on anything that isn't a letter or a digit.
+TERM_PATTERN = r"[a-z0-9]+"
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 30
+STOPWORDS = (
+    "an and are as at be by can for from if in is it of on or our "
+    "that the this to we will with you your"
+).split()
+# Shards are keyed by the first characters of their terms.
+SHARD_PREFIX_LENGTH = 2
+FIELD_WEIGHTS = {"title": 5, "symbols": 5, "headings": 3, "text": 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Prefix matches of the last query term count for less than exact matches.
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 50
+
+_TERM = re.compile(TERM_PATTERN)
+_STOPWORDS = frozenset(STOPWORDS)
+
+
+def tokenize(text):
+    return [
+        term
+        for term in _TERM.findall(text.lower())
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in _STOPWORDS
+    ]
+
+
+def get_shard_name(term):
+    return term[:SHARD_PREFIX_LENGTH]
+
+
+class TextExtractor(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+
+    def handle_data(self, data):
+        self.chunks.append(data)
+
+
+def html_to_text(html_content):
+    extractor = TextExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return " ".join(extractor.chunks)
+
+
+def make_document(url, title, html_content, outline):
+    """Search document of a rendered page (weighted term frequencies)."""
+    headings = " ".join(re.sub(r"<.*?>", "", heading["title"]) for heading in outline)
+    terms = collections.Counter()
+    for field, text in (
+        ("title", title),
+        ("headings", headings),
+        ("text", html_to_text(html_content)),
+    ):
+        for term in tokenize(text):
+            terms[term] += FIELD_WEIGHTS[field]
+    return {"url": url, "title": title, "terms": dict(terms)}
+
+
+def add_symbols(document, symbols):
+    """Add the API symbols documented on a page (e.g. `keras.layers.Dense`)."""
+    terms = document["terms"]
+    for symbol in symbols:
+        for term in tokenize(symbol):
+            terms[term] = terms.get(term, 0) + FIELD_WEIGHTS["symbols"]
+
+
+def build_index(documents, index_dir):
+    """Compute BM25 weights and write the sharded index to `index_dir`."""
+    documents = sorted(documents, key=lambda document: document["url"])
+    num_docs = len(documents)
+    lengths = [sum(document["terms"].values()) for document in documents]
+    avg_length = sum(lengths) / max(num_docs, 1)
+    postings = collections.defaultdict(list)
+    for doc_id, document in enumerate(documents):
+        for term, tf in document["terms"].items():
+            postings[term].append((doc_id, tf))
+
+    shards = collections.defaultdict(dict)
+    for term, term_postings in postings.items():
+        df = len(term_postings)
+        idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        flat = []
+        for doc_id, tf in term_postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / avg_length)
+            score = idf * tf * (BM25_K1 + 1) / (tf + norm)
+            flat += [doc_id, max(1, round(score * 100))]
+        shards[get_shard_name(term)][term] = flat
+
+    index_dir = Path(index_dir)
+    if os.path.exists(index_dir / "shards"):
+        for fname in os.listdir(index_dir / "shards"):
+            os.remove(index_dir / "shards" / fname)
+    for shard_name, shard in shards.items():
+        autogen_utils.save_file(
+            index_dir / "shards" / (shard_name + ".json"),
+            json.dumps(shard, sort_keys=True, separators=(",", ":")),
+        )
+    docs = [[document["url"], document["title"]] for document in documents]
+    autogen_utils.save_file(
+        index_dir / "docs.json", json.dumps(docs, separators=(",", ":"))
+    )
+    meta = {
+        "version": INDEX_VERSION,
+        "num_docs": num_docs,
+        "term_pattern": TERM_PATTERN,
+        "min_term_length": MIN_TERM_LENGTH,
+        "max_term_length": MAX_TERM_LENGTH,
+        "stopwords": STOPWORDS,
+        "shard_prefix_length": SHARD_PREFIX_LENGTH,
+        "prefix_weight": PREFIX_WEIGHT,
+        "max_prefix_expansions": MAX_PREFIX_EXPANSIONS,
+        "shards": sorted(shards),
+    }
+    autogen_utils.save_file(index_dir / "meta.json", json.dumps(meta, indent=1))
+    print(
+        f"Indexed {num_docs} pages for search: {len(postings)} terms "
+        f"in {len(shards)} shards"
+    )
+
+
+class SearchIndex:
+    """Query API over an index written by `build_index`."""
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "meta.json") as f:
+            self.meta = json.loads(f.read())
+        if self.meta["version"] != INDEX_VERSION:
+            raise ValueError(
+                f"Unsupported search index version: {self.meta['version']}"
+            )
+        with open(self.index_dir / "docs.json") as f:
+            self.docs = json.loads(f.read())
+        self.shard_names = set(self.meta["shards"])
+        self._shards = {}
+
+    def get_shard(self, term):
+        shard_name = get_shard_name(term)
+        if shard_name not in self.shard_names:
+            return {}
+        if shard_name not in self._shards:
+            with open(self.index_dir / "shards" / (shard_name + ".json")) as f:
+                shard = json.loads(f.read())
+            self._shards[shard_name] = (shard, sorted(shard))
+        return self._shards[shard_name][0]
+
+    def expand(self, term):
+        """Terms of the index starting with `term` (including itself)."""
+        self.get_shard(term)
+        if get_shard_name(term) not in self._shards:
+            return []
+        _, terms = self._shards[get_shard_name(term)]
+        # Terms are sorted, so the matches are contiguous.
+        start = bisect.bisect_left(terms, term)
+        expanded = []
+        for t in terms[start : start + MAX_PREFIX_EXPANSIONS]:
+            if not t.startswith(term):
+                break
+            expanded.append(t)
+        return expanded
+
+    def search(self, query, limit=10):
+        """Return the `limit` best matches for `query`, as dicts with the
+        `url`, `title` and `score` of each page.
+
+        Pages matching more of the query terms rank first, then pages with
+        the highest total score.
+        """
+        terms = tokenize(query)
+        scores = collections.defaultdict(float)
+        matches = collections.defaultdict(int)
+        for i, term in enumerate(terms):
+            shard = self.get_shard(term)
+            term_scores = {}
+            candidates = [term]
+            if i == len(terms) - 1:
+                candidates = self.expand(term) or [term]
+            for candidate in candidates:
+                postings = shard.get(candidate, [])
+                weight = 1.0 if candidate == term else PREFIX_WEIGHT
+                for j in range(0, len(postings), 2):
+                    doc_id = postings[j]
+                    score = postings[j + 1] / 100 * weight
+                    term_scores[doc_id] = max(term_scores.get(doc_id, 0), score)
+            for doc_id, score in term_scores.items():
+                scores[doc_id] += score
+                matches[doc_id] += 1
+        ranked = sorted(scores, key=lambda doc_id: (-matches[doc_id], -scores[doc_id]))
+        return [
+            {
+                "url": self.docs[doc_id][0],
+                "title": self.docs[doc_id][1],
+                "score": scores[doc_id],
+            }
+            for doc_id in ranked[:limit]
+        ]
@@ -0,0 +1,219 @@
+"""Prelude run in the notebook kernel before each tutobook in smoke mode.
+
+Smoke mode (`python tutobooks.py run_all --smoke`) checks that tutobooks run
+end to end, not that they train good models. This prelude downscales them:
+
+- `keras.Model.fit` runs at most `SMOKE_EPOCHS` epochs of at most
+  `SMOKE_STEPS` steps, and `evaluate` at most `SMOKE_STEPS` steps.
+- `keras.datasets.*.load_data` arrays are cut to `SMOKE_EXAMPLES` samples.
+- `keras.utils.*_dataset_from_directory` datasets are cut to
+  `SMOKE_BATCHES` batches.
+- `tensorflow_datasets.load` splits are cut to `SMOKE_EXAMPLES` samples.
+- `tf.data` pipelines built by the tutobook itself are cut to
+  `SMOKE_EXAMPLES` elements at their source (`Dataset.from_tensor_slices`,
+  `from_generator`, `list_files`, `load`, `TFRecordDataset` and
+  `TextLineDataset`). Datasets built internally by Keras and TensorFlow
+  (e.g. from the arrays passed to `fit()`) are left alone.
+- Optionally (`SMOKE_IMAGE_SIZE`), the `image_size` requested from
+  `keras.utils.image_dataset_from_directory` is capped. This is off by
+  default since most models hardcode their input shape.
+
+Patches are applied when the module is imported (or right away if it
+already is), and only once per kernel.
+"""
+
+import functools
+import importlib.abc
+import inspect
+import os
+import sys
+
+SMOKE_EPOCHS = 1
+SMOKE_STEPS = 2
+SMOKE_BATCHES = 2
+SMOKE_EXAMPLES = 256
+SMOKE_IMAGE_SIZE = int(os.environ.get("SMOKE_IMAGE_SIZE", 0)) or None
+
+
+def cap(value, limit):
+    return limit if value is None else min(value, limit)
+
+
+def patch_keras(keras):
+    fit = keras.Model.fit
+    fit_signature = inspect.signature(fit)
+
+    @functools.wraps(fit)
+    def smoke_fit(self, *args, **kwargs):
+        bound = fit_signature.bind(self, *args, **kwargs)
+        arguments = bound.arguments
+        initial_epoch = arguments.get("initial_epoch", 0)
+        epochs = arguments.get("epochs", 1)
+        arguments["epochs"] = initial_epoch + min(epochs - initial_epoch, SMOKE_EPOCHS)
+        arguments["steps_per_epoch"] = cap(
+            arguments.get("steps_per_epoch"), SMOKE_STEPS
+        )
+        if arguments.get("validation_data") is not None:
+            arguments["validation_steps"] = cap(
+                arguments.get("validation_steps"), SMOKE_STEPS
+            )
+        return fit(*bound.args, **bound.kwargs)
+
+    evaluate = keras.Model.evaluate
+    evaluate_signature = inspect.signature(evaluate)
+
+    @functools.wraps(evaluate)
+    def smoke_evaluate(self, *args, **kwargs):
+        bound = evaluate_signature.bind(self, *args, **kwargs)
+        bound.arguments["steps"] = cap(bound.arguments.get("steps"), SMOKE_STEPS)
+        return evaluate(*bound.args, **bound.kwargs)
+
+    keras.Model.fit = smoke_fit
+    keras.Model.evaluate = smoke_evaluate
+
+    for name in dir(keras.datasets):
+        dataset_module = getattr(keras.datasets, name)
+        if hasattr(dataset_module, "load_data"):
+            dataset_module.load_data = cut_arrays(dataset_module.load_data)
+
+    for module in (keras.utils, getattr(keras, "preprocessing", None)):
+        for name in (
+            "image_dataset_from_directory",
+            "text_dataset_from_directory",
+            "audio_dataset_from_directory",
+        ):
+            if module is not None and hasattr(module, name):
+                setattr(module, name, cut_datasets(getattr(module, name)))
+
+
+def cut_arrays(load_data):
+    def cut(value):
+        if isinstance(value, (tuple, list)):
+            return type(value)(cut(item) for item in value)
+        if hasattr(value, "shape") and len(value.shape):
+            return value[:SMOKE_EXAMPLES]
+        return value
+
+    @functools.wraps(load_data)
+    def smoke_load_data(*args, **kwargs):
+        return cut(load_data(*args, **kwargs))
+
+    return smoke_load_data
+
+
+def cut_datasets(dataset_from_directory):
+    def cut(dataset):
+        small_dataset = dataset.take(SMOKE_BATCHES)
+        # e.g. `class_names`, which `take()` doesn't carry over.
+        for name in ("class_names", "file_paths"):
+            if hasattr(dataset, name):
+                setattr(small_dataset, name, getattr(dataset, name))
+        return small_dataset
+
+    @functools.wraps(dataset_from_directory)
+    def smoke_dataset_from_directory(*args, **kwargs):
+        if SMOKE_IMAGE_SIZE and "image_size" in kwargs:
+            kwargs["image_size"] = tuple(
+                min(size, SMOKE_IMAGE_SIZE) for size in kwargs["image_size"]
+            )
+        result = dataset_from_directory(*args, **kwargs)
+        if isinstance(result, (tuple, list)):
+            return type(result)(cut(dataset) for dataset in result)
+        return cut(result)
+
+    return smoke_dataset_from_directory
+
+
+def patch_tensorflow_datasets(tfds):
+    load = tfds.load
+
+    def cut_split(split):
+        if isinstance(split, str) and "[" not in split and "+" not in split:
+            return f"{split}[:{SMOKE_EXAMPLES}]"
+        if isinstance(split, (tuple, list)):
+            return type(split)(cut_split(item) for item in split)
+        return split
+
+    @functools.wraps(load)
+    def smoke_load(*args, **kwargs):
+        if "split" in kwargs:
+            kwargs["split"] = cut_split(kwargs["split"])
+        return load(*args, **kwargs)
+
+    tfds.load = smoke_load
+
+
+def cut_source(make_dataset):
+    @functools.wraps(make_dataset)
+    def smoke_make_dataset(*args, **kwargs):
+        dataset = make_dataset(*args, **kwargs)
+        # Notebook cells run in `__main__`, unlike Keras and TensorFlow code.
+        if sys._getframe(1).f_globals.get("__name__") == "__main__":
+            dataset = dataset.take(SMOKE_EXAMPLES)
+        return dataset
+
+    return smoke_make_dataset
+
+
+def patch_tensorflow(tf):
+    dataset_class = tf.data.Dataset
+    for name in ("from_tensor_slices", "from_generator", "list_files", "load"):
+        if hasattr(dataset_class, name):
+            make_dataset = cut_source(getattr(dataset_class, name))
+            setattr(dataset_class, name, staticmethod(make_dataset))
+    for name in ("TFRecordDataset", "TextLineDataset"):
+        if hasattr(tf.data, name):
+            setattr(tf.data, name, cut_source(getattr(tf.data, name)))
+
+
+PATCHES = {
+    "keras": patch_keras,
+    "tensorflow": patch_tensorflow,
+    "tensorflow_datasets": patch_tensorflow_datasets,
+}
+
+
+class SmokePatchFinder(importlib.abc.MetaPathFinder):
+    """Applies `PATCHES` to modules right after they are imported."""
+
+    def __init__(self):
+        self.patched = set()
+
+    def patch(self, module):
+        if module.__name__ not in self.patched:
+            self.patched.add(module.__name__)
+            PATCHES[module.__name__](module)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in PATCHES or fullname in self.patched:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+            self.patch(module)
+
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+def install():
+    for finder in sys.meta_path:
+        if type(finder).__name__ == "SmokePatchFinder":
+            return
+    finder = SmokePatchFinder()
+    sys.meta_path.insert(0, finder)
+    for name in PATCHES:
+        if name in sys.modules:
+            finder.patch(sys.modules[name])
+
+
+install()
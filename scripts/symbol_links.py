@@ -0,0 +1,116 @@
+"""Auto-linking of Keras and TensorFlow symbols in Markdown sources.
+
+Symbols are referenced as inline code spans, e.g. `keras.layers.Dense` or
+`tf.data.Dataset`. Keras symbols are linked to their keras.io API page,
+TF symbols to tensorflow.org.
+
+`SymbolLinker.link()` rewrites each page in linear time, with one scan over
+its code spans per kind of link. Its output is identical to running one
+`str.replace` per known symbol.
+"""
+
+import re
+
+TF_API_DOCS_URL = "https://www.tensorflow.org/api_docs/python/"
+
+# Matches every backtick-delimited span, including overlapping ones
+# (both "`a`" and "`b`" in "`a`b`").
+_CODE_SPAN = re.compile(r"(?=(`[^`]+`))")
+
+
+def make_tf_link(symbol):
+    """Link to the tensorflow.org page of e.g. `tf.data.Dataset`."""
+    # Check if we're looking at a method on a class
+    symbol_parts = symbol.split(".")
+    if len(symbol_parts) >= 3 and symbol_parts[-2][0].isupper():
+        # In this case the link should look like ".../class#method"
+        path = "/".join(symbol_parts[:-1]) + "#" + symbol_parts[-1]
+    else:
+        # Otherwise just ".../module/class_or_fn"
+        path = symbol.replace(".", "/")
+    path = path.replace("(", "")
+    path = path.replace(")", "")
+    return "[`" + symbol + "`](" + TF_API_DOCS_URL + path + ")"
+
+
+def find_tf_links(md_content):
+    """Collect the TF symbols to link in `md_content`.
+
+    Returns a dict mapping each code span (e.g. "`tf.data.Dataset`") to its
+    link. Code spans already preceded by `[` are skipped.
+    """
+    links = {}
+    # `pos` is the start of the not-yet-scanned content.
+    pos = 0
+    while True:
+        index = md_content.find("`tf.", pos)
+        if index == -1:
+            break
+        # When the match is right at `pos`, the original slicing-based scan
+        # looked at the *last* character of the content instead.
+        previous_char = md_content[index - 1] if index > pos else md_content[-1]
+        pos = index + 1
+        close = md_content.find("`", pos)
+        if previous_char == "[":
+            if close != -1:
+                pos = close + 1
+            continue
+        if close == -1:
+            symbol = md_content[pos:-1]
+        else:
+            symbol = md_content[pos:close]
+            pos = close + 1
+        if "/" not in symbol and "(" not in symbol:
+            links["`" + symbol + "`"] = make_tf_link(symbol)
+    return links
+
+
+def replace_code_spans(md_content, links):
+    """Replace every code span of `md_content` that is a key of `links`.
+
+    This is equivalent to calling `md_content.replace(key, value)` for each
+    item of `links`, but runs in a single scan. Returns None if two
+    replaceable spans overlap (share a backtick), since the result of the
+    sequential replacements then depends on their order.
+    """
+    pieces = []
+    last = 0
+    for match in _CODE_SPAN.finditer(md_content):
+        span = match.group(1)
+        link = links.get(span)
+        if link is None:
+            continue
+        start = match.start()
+        if start < last:
+            return None
+        pieces.append(md_content[last:start])
+        pieces.append(link)
+        last = start + len(span)
+    pieces.append(md_content[last:])
+    return "".join(pieces)
+
+
+def replace_sequentially(md_content, links):
+    for key, value in links.items():
+        md_content = md_content.replace(key, value)
+    return md_content
+
+
+class SymbolLinker:
+    def __init__(self, symbol_to_link_map):
+        """`symbol_to_link_map` maps e.g. "`keras.Model`" to its md link."""
+        self.symbol_to_link_map = symbol_to_link_map
+
+    def link(self, md_content):
+        # Convert Keras symbols to links to the Keras docs
+        linked = replace_code_spans(md_content, self.symbol_to_link_map)
+        if linked is None:
+            linked = replace_sequentially(md_content, self.symbol_to_link_map)
+        # Convert TF symbols to links to tensorflow.org
+        tf_links = find_tf_links(linked)
+        if not tf_links:
+            return linked
+        md_content = replace_code_spans(linked, tf_links)
+        if md_content is None:
+            md_content = replace_sequentially(linked, tf_links)
+        return md_content
@@ -0,0 +1,53 @@
+import build_manifest
+
+
+def test_hash_content():
+    assert build_manifest.hash_content("a", {"b": 1}) == build_manifest.hash_content(
+        "a", {"b": 1}
+    )
+    assert build_manifest.hash_content("ab", "c") != build_manifest.hash_content(
+        "a", "bc"
+    )
+    assert build_manifest.hash_content({"a": 1, "b": 2}) == (
+        build_manifest.hash_content({"b": 2, "a": 1})
+    )
+    assert build_manifest.hash_content("a") == build_manifest.hash_content(b"a")
+
+
+def test_hash_files(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    paths = [tmp_path / "dir", tmp_path / "b.txt"]
+    digest = build_manifest.hash_files(paths)
+    assert build_manifest.hash_files(paths) == digest
+    (tmp_path / "dir" / "a.txt").write_text("A")
+    assert build_manifest.hash_files(paths) != digest
+
+
+def test_manifest_freshness_and_stale_outputs(tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    kept = tmp_path / "kept.html"
+    stale = tmp_path / "stale.html"
+    kept.write_text("kept")
+    stale.write_text("stale")
+    manifest = build_manifest.BuildManifest(manifest_path)
+    manifest.record("kept.md", "1", [kept])
+    manifest.record("stale.md", "1", [stale])
+    manifest.save()
+
+    manifest = build_manifest.BuildManifest(manifest_path)
+    assert manifest.is_fresh("kept.md", "1")
+    assert not manifest.is_fresh("kept.md", "2")
+    assert manifest.remove_stale() == ["stale.md"]
+    assert kept.exists() and not stale.exists()
+
+    # Missing outputs make a page stale.
+    kept.unlink()
+    assert not manifest.is_fresh("kept.md", "1")
+
+
+def test_corrupted_manifest(tmp_path):
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text("{")
+    assert build_manifest.BuildManifest(manifest_path).entries == {}
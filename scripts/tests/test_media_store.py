@@ -0,0 +1,57 @@
+import io
+import os
+
+import pytest
+
+import media_store
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_png(color=(255, 0, 0)):
+    # Saved without optimization, so that `optimize_png` shrinks it.
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="PNG", compress_level=0)
+    return buffer.getvalue()
+
+
+def test_add_optimizes_and_dedups(tmp_path):
+    store = media_store.MediaStore(tmp_path / "store")
+    data = make_png()
+    fname = store.add(data, "png")
+    stored = (tmp_path / "store" / fname).read_bytes()
+    assert len(stored) < len(data)
+    assert fname == media_store.get_digest(stored) + ".png"
+    # Adding the original or the stored bytes again gives the same blob.
+    assert store.add(data, "png") == fname
+    assert store.add(stored, "png") == fname
+    assert os.listdir(tmp_path / "store") == [fname]
+
+
+def test_sync_dir_reuses_linked_blobs(tmp_path):
+    store = media_store.MediaStore(tmp_path / "store")
+    fname = store.add(make_png(), "png")
+    img_dir = tmp_path / "img"
+    store.link(fname, img_dir, target_fname="plot.png")
+    (img_dir / "other.png").write_bytes(make_png((0, 0, 255)))
+
+    store.sync_dir(img_dir, tmp_path / "site" / "img")
+    blobs = sorted(os.listdir(tmp_path / "store"))
+    assert len(blobs) == 2
+    site_plot = tmp_path / "site" / "img" / "plot.png"
+    assert os.stat(site_plot).st_ino == os.stat(tmp_path / "store" / fname).st_ino
+    assert (tmp_path / "site" / "img" / "other.png").exists()
+
+
+def test_variants(tmp_path):
+    store = media_store.MediaStore(tmp_path / "store", variants=("webp",))
+    fname = store.add(make_png(), "png")
+    stem = fname[: -len(".png")]
+    assert (tmp_path / "store" / (stem + ".webp")).exists()
+    store.link(fname, tmp_path / "img", target_fname="plot.png")
+    assert (tmp_path / "img" / "plot.webp").exists()
+
+
+def test_unknown_variant():
+    with pytest.raises(ValueError, match="Unknown image variant"):
+        media_store.MediaStore(variants=("bmp",))
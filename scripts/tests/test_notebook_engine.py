@@ -0,0 +1,113 @@
+import contextlib
+import os
+
+import pytest
+
+pytest.importorskip("nbclient")
+
+import nbformat
+
+import notebook_engine
+import tutobook_scheduler
+
+
+class FakeKernelManager:
+    """Records its shutdown in a marker file, from whichever process."""
+
+    def __init__(self, marker_path):
+        self.marker_path = marker_path
+
+    async def is_alive(self):
+        return True
+
+    async def shutdown_kernel(self, now=False):
+        with open(self.marker_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+
+    async def cleanup_resources(self):
+        pass
+
+
+def run_job_with_warm_kernel(job):
+    # Leave a warm kernel in the default pool of the worker, as `run_job` does.
+    pool = notebook_engine.get_default_pool()
+    pool.release(FakeKernelManager(job["marker_path"]), "tensorflow", uses=1)
+    return {
+        "name": job["name"],
+        "success": True,
+        "runtime": 0.0,
+        "error": None,
+        "cell_error": None,
+    }
+
+
+def test_kernel_pool_release_and_shutdown(tmp_path):
+    marker_path = tmp_path / "shutdown.txt"
+    pool = notebook_engine.KernelPool(max_uses=2)
+    km = FakeKernelManager(marker_path)
+    pool.release(km, "jax", uses=1)
+    assert pool.acquire("jax") == (km, 1)
+    # Worn out kernels are shut down instead of going back to the pool.
+    pool.release(km, "jax", uses=2)
+    assert marker_path.read_text().count("\n") == 1
+    pool.release(km, "jax", uses=1)
+    pool.shutdown()
+    assert marker_path.read_text().count("\n") == 2
+
+
+def test_run_jobs_shuts_down_worker_kernels(tmp_path, monkeypatch):
+    monkeypatch.setattr(tutobook_scheduler, "run_job", run_job_with_warm_kernel)
+    marker_path = tmp_path / "shutdown.txt"
+    jobs = [{"name": f"job_{i}", "marker_path": str(marker_path)} for i in range(4)]
+    results = tutobook_scheduler.run_jobs(jobs, num_workers=2)
+    assert all(result["success"] for result in results)
+    # Every warm kernel was shut down by the worker that started it.
+    pids = marker_path.read_text().split()
+    assert len(pids) == 4
+    assert str(os.getpid()) not in pids
+
+
+class FakeKernelClient:
+    def execute(self, code, **kwargs):
+        return "msg_id"
+
+    def stop_channels(self):
+        pass
+
+
+class FakeNotebookClient:
+    def __init__(self, nb, km=None, **kwargs):
+        self.kc = None
+
+    def reset_execution_trackers(self):
+        pass
+
+    @contextlib.contextmanager
+    def setup_kernel(self, **kwargs):
+        self.kc = FakeKernelClient()
+        yield
+
+    def wait_for_reply(self, msg_id):
+        return {"content": {"status": "ok"}}
+
+
+def test_kernel_dies_before_first_cell(tmp_path, monkeypatch):
+    from nbclient.exceptions import DeadKernelError
+
+    def dead_kernel_usage(client):
+        raise DeadKernelError("Kernel died")
+
+    monkeypatch.setattr(notebook_engine, "NotebookClient", FakeNotebookClient)
+    monkeypatch.setattr(notebook_engine, "get_kernel_usage", dead_kernel_usage)
+    marker_path = tmp_path / "shutdown.txt"
+    pool = notebook_engine.KernelPool()
+    pool.release(FakeKernelManager(marker_path), "tensorflow", uses=1)
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell("import keras"))
+    with pytest.raises(notebook_engine.NotebookExecutionError) as excinfo:
+        notebook_engine.execute_notebook(nb, tmp_path, pool=pool)
+    assert excinfo.value.cell_index is None
+    assert excinfo.value.ename == "DeadKernelError"
+    assert "before the first cell" in str(excinfo.value)
+    # The dead kernel is discarded.
+    assert marker_path.read_text().count("\n") == 1
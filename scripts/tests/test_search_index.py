@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import search_index
+
+
+def make_documents():
+    return [
+        search_index.make_document(
+            "/api/layers/dense/",
+            "Dense layer",
+            "<p>Just your regular densely-connected NN layer.</p>",
+            [{"title": "<code>Dense</code> class"}],
+        ),
+        search_index.make_document(
+            "/api/layers/conv2d/",
+            "Conv2D layer",
+            "<p>2D convolution layer. It is not a dense layer.</p>",
+            [],
+        ),
+        search_index.make_document(
+            "/guides/functional_api/",
+            "The Functional API",
+            "<p>Build models with layers &amp; tensors.</p>",
+            [],
+        ),
+    ]
+
+
+@pytest.fixture
+def index(tmp_path):
+    documents = make_documents()
+    search_index.add_symbols(documents[0], ["keras.layers.Dense"])
+    search_index.build_index(documents, tmp_path / "search_index")
+    return search_index.SearchIndex(tmp_path / "search_index")
+
+
+def test_tokenize():
+    assert search_index.tokenize("The Conv2D layer, and x & keras.layers!") == [
+        "conv2d",
+        "layer",
+        "keras",
+        "layers",
+    ]
+
+
+def test_make_document():
+    document = make_documents()[2]
+    weights = search_index.FIELD_WEIGHTS
+    assert document["terms"]["functional"] == weights["title"]
+    assert document["terms"]["tensors"] == weights["text"]
+    # HTML entities are decoded and tags stripped.
+    assert "amp" not in document["terms"]
+
+
+def test_index_files(index, tmp_path):
+    meta = json.loads((tmp_path / "search_index" / "meta.json").read_text())
+    assert meta["num_docs"] == 3
+    shard = json.loads((tmp_path / "search_index" / "shards" / "de.json").read_text())
+    # Postings are flat `[doc_id, score, ...]` lists. Documents are sorted by
+    # URL: conv2d, dense, functional_api.
+    assert shard["dense"][0::2] == [0, 1]
+    assert all(isinstance(score, int) and score > 0 for score in shard["dense"][1::2])
+
+
+def test_search_ranking(index):
+    results = index.search("dense layer")
+    # Pages matching more terms first, then by BM25 score. "layer" also
+    # matches "layers" as a prefix.
+    assert [result["url"] for result in results] == [
+        "/api/layers/dense/",
+        "/api/layers/conv2d/",
+        "/guides/functional_api/",
+    ]
+    assert results[0]["score"] > results[1]["score"]
+    assert index.search("keras.layers.Dense")[0]["url"] == "/api/layers/dense/"
+    assert index.search("") == []
+    assert index.search("nonexistent") == []
+
+
+def test_search_prefix(index):
+    # The last term also matches as a prefix, at a lower weight.
+    assert [result["url"] for result in index.search("functi")] == [
+        "/guides/functional_api/"
+    ]
+    exact_score = index.search("functional")[0]["score"]
+    assert index.search("functi")[0]["score"] == pytest.approx(
+        exact_score * search_index.PREFIX_WEIGHT
+    )
+    # Only the last term is expanded.
+    assert index.search("functi layers") == index.search("layers")
+
+
+def test_index_version(index, tmp_path):
+    meta_path = tmp_path / "search_index" / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta["version"] = search_index.INDEX_VERSION + 1
+    meta_path.write_text(json.dumps(meta))
+    with pytest.raises(ValueError, match="Unsupported search index version"):
+        search_index.SearchIndex(tmp_path / "search_index")
@@ -0,0 +1,78 @@
+import sys
+import types
+
+import pytest
+
+import smoke_prelude
+
+# Importing the prelude installs its import hook: keep it out of the tests.
+sys.meta_path[:] = [
+    finder
+    for finder in sys.meta_path
+    if not isinstance(finder, smoke_prelude.SmokePatchFinder)
+]
+
+
+class FakeDataset:
+    def __init__(self, elements):
+        self.elements = list(elements)
+
+    def take(self, count):
+        return FakeDataset(self.elements[:count])
+
+    @staticmethod
+    def from_tensor_slices(tensors):
+        return FakeDataset(tensors)
+
+    @staticmethod
+    def from_generator(generator):
+        return FakeDataset(generator())
+
+
+def make_fake_tf():
+    data = types.SimpleNamespace(
+        Dataset=type("Dataset", (FakeDataset,), {}),
+        TFRecordDataset=lambda filenames: FakeDataset(range(10000)),
+    )
+    return types.SimpleNamespace(data=data)
+
+
+def test_tf_data_sources_are_cut_in_notebook_code():
+    tf = make_fake_tf()
+    smoke_prelude.patch_tensorflow(tf)
+    namespace = {"__name__": "__main__", "tf": tf}
+    exec(
+        "a = tf.data.Dataset.from_tensor_slices(range(10000))\n"
+        "b = tf.data.Dataset.from_generator(lambda: range(10000))\n"
+        "c = tf.data.TFRecordDataset(['data.tfrecord'])\n",
+        namespace,
+    )
+    for name in ("a", "b", "c"):
+        assert len(namespace[name].elements) == smoke_prelude.SMOKE_EXAMPLES
+
+
+def test_tf_data_sources_of_libraries_are_not_cut():
+    tf = make_fake_tf()
+    smoke_prelude.patch_tensorflow(tf)
+    # e.g. the dataset built by Keras from the arrays passed to `fit()`.
+    dataset = tf.data.Dataset.from_tensor_slices(range(10000))
+    assert len(dataset.elements) == 10000
+
+
+def test_tfds_splits_are_cut():
+    calls = []
+    tfds = types.SimpleNamespace(load=lambda name, **kwargs: calls.append(kwargs))
+    smoke_prelude.patch_tensorflow_datasets(tfds)
+    tfds.load("mnist", split=["train", "test[:10%]"])
+    n = smoke_prelude.SMOKE_EXAMPLES
+    assert calls[0]["split"] == [f"train[:{n}]", "test[:10%]"]
+
+
+def test_cut_arrays():
+    numpy = pytest.importorskip("numpy")
+    load_data = smoke_prelude.cut_arrays(
+        lambda: ((numpy.zeros((1000, 2)), numpy.zeros(1000)), (numpy.zeros(3),))
+    )
+    (x, y), (z,) = load_data()
+    assert len(x) == len(y) == smoke_prelude.SMOKE_EXAMPLES
+    assert len(z) == 3
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import tutobook_cache
+
+SCRIPT = '"""\nTitle: Example\nAccelerator: GPU\n"""\n\nx = 1\n'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return tutobook_cache.NotebookCache(tmp_path / "cache")
+
+
+@pytest.fixture
+def py_path(tmp_path):
+    path = tmp_path / "example.py"
+    path.write_text(SCRIPT)
+    return path
+
+
+def test_key_inputs(cache, py_path, monkeypatch):
+    monkeypatch.setenv("KERAS_BACKEND", "jax")
+    key_inputs = cache.get_key_inputs(py_path, "img")
+    assert key_inputs["accelerator"] == "GPU"
+    assert key_inputs["backend"] == "jax"
+    key = cache.get_key(key_inputs)
+    assert cache.get_key(cache.get_key_inputs(py_path, "img")) == key
+
+    # Any change to the script, backend or image directory changes the key.
+    assert cache.get_key(cache.get_key_inputs(py_path, "other_img")) != key
+    monkeypatch.setenv("KERAS_BACKEND", "torch")
+    assert cache.get_key(cache.get_key_inputs(py_path, "img")) != key
+    monkeypatch.setenv("KERAS_BACKEND", "jax")
+    py_path.write_text(SCRIPT.replace("x = 1", "x = 2"))
+    assert cache.get_key(cache.get_key_inputs(py_path, "img")) != key
+
+
+def test_store_and_restore(cache, py_path, tmp_path):
+    key_inputs = cache.get_key_inputs(py_path, "img")
+    key = cache.get_key(key_inputs)
+    nb_path = tmp_path / "example.ipynb"
+    nb_path.write_text("{}")
+    md_path = tmp_path / "md" / "example.md"
+    md_path.parent.mkdir()
+    md_path.write_text("# Example\n")
+    img_dir = tmp_path / "img"
+    (img_dir / "example").mkdir(parents=True)
+    (img_dir / "example" / "plot.png").write_bytes(b"png")
+
+    assert not cache.restore(key, md_path, img_dir)
+    cache.store(key, key_inputs, "vision/example", nb_path, md_path, img_dir)
+
+    restored_md_path = tmp_path / "restored" / "example.md"
+    restored_md_path.parent.mkdir()
+    restored_img_dir = tmp_path / "restored_img"
+    assert cache.restore(key, restored_md_path, restored_img_dir)
+    assert restored_md_path.read_text() == "# Example\n"
+    assert (restored_img_dir / "example" / "plot.png").read_bytes() == b"png"
+
+
+def test_stale_keys(cache, tmp_path):
+    def add_entry(key, name, created, **overrides):
+        key_inputs = {"versions": cache.versions, "code_version": cache.code_version}
+        key_inputs.update(overrides)
+        entry = {"name": name, "created": created, "key_inputs": key_inputs}
+        (cache.cache_dir / key).mkdir(parents=True)
+        (cache.cache_dir / key / "entry.json").write_text(json.dumps(entry))
+
+    add_entry("new", "vision/a", 2)
+    add_entry("superseded", "vision/a", 1)
+    add_entry("old_code", "vision/b", 1, code_version="old")
+    add_entry("fresh", "vision/c", 1)
+    assert sorted(cache.get_stale_keys()) == ["old_code", "superseded"]
+    cache.evict(cache.get_stale_keys())
+    assert [key for key, _ in cache.list_entries()] == ["new", "fresh"]
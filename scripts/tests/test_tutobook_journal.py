@@ -0,0 +1,75 @@
+import pytest
+
+import tutobook_journal
+
+
+def test_swap_in_file(tmp_path):
+    staged = tmp_path / "staged.md"
+    target = tmp_path / "target.md"
+    staged.write_text("new")
+    target.write_text("old")
+    tutobook_journal.swap_in(staged, target)
+    assert target.read_text() == "new"
+    assert not staged.exists()
+
+
+def test_swap_in_dir(tmp_path):
+    staged = tmp_path / "staged"
+    target = tmp_path / "target"
+    staged.mkdir()
+    (staged / "new.png").write_bytes(b"new")
+    target.mkdir()
+    (target / "old.png").write_bytes(b"old")
+    # Left over by an interrupted swap.
+    (tmp_path / "target.old").mkdir()
+
+    tutobook_journal.swap_in(staged, target)
+    assert [path.name for path in target.iterdir()] == ["new.png"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["target"]
+
+
+def test_run_journal_resume(tmp_path):
+    py_path = tmp_path / "example.py"
+    py_path.write_text("x = 1\n")
+    job = {"name": "vision/example", "py_path": py_path}
+    journal_path = tmp_path / "journal" / "journal.jsonl"
+
+    journal = tutobook_journal.RunJournal(journal_path)
+    assert not journal.is_done(job)
+    journal.record(job)
+    # A line truncated by a crash is ignored.
+    with open(journal_path, "a") as f:
+        f.write('{"name": "vision/oth')
+
+    journal = tutobook_journal.RunJournal(journal_path, resume=True)
+    assert journal.is_done(job)
+    other_job = {"name": "vision/other", "py_path": py_path}
+    journal.record(other_job)
+    assert tutobook_journal.RunJournal(journal_path, resume=True).is_done(other_job)
+    py_path.write_text("x = 2\n")
+    assert not tutobook_journal.RunJournal(journal_path, resume=True).is_done(job)
+    # Without `resume`, the journal starts over.
+    py_path.write_text("x = 1\n")
+    assert not tutobook_journal.RunJournal(journal_path).is_done(job)
+
+
+def test_remove_stale_tutobook_outputs(tmp_path):
+    autogen = pytest.importorskip("autogen")
+    target_dir = tmp_path / "md"
+    img_dir = tmp_path / "img"
+    (target_dir / "keras_hub").mkdir(parents=True)
+    (target_dir / "keras_hub" / "getting_started.md").write_text("# Hub")
+    for name in ("kept", "removed"):
+        (target_dir / (name + ".md")).write_text("# Title")
+        (target_dir / (name + ".profile.json")).write_text("{}")
+        (img_dir / name).mkdir(parents=True)
+    jobs = [{"md_path": tmp_path / "staging" / "md" / "kept.md"}]
+
+    autogen.remove_stale_tutobook_outputs(target_dir, img_dir, jobs)
+    assert sorted(path.name for path in target_dir.iterdir()) == [
+        "kept.md",
+        "kept.profile.json",
+        "keras_hub",
+    ]
+    assert (target_dir / "keras_hub" / "getting_started.md").exists()
+    assert [path.name for path in img_dir.iterdir()] == ["kept"]
@@ -0,0 +1,62 @@
+import pytest
+
+import tutobooks
+
+SCRIPT = '''"""
+Title: Example
+Accelerator: None
+"""
+
+"""
+## Setup
+"""
+import keras
+
+"""shell
+pip install keras
+"""
+
+x = 1
+'''
+
+
+def test_parse_script():
+    cells = tutobooks.parse_script(SCRIPT)
+    assert [cell.cell_type for cell in cells] == [
+        "header",
+        "code",
+        "markdown",
+        "code",
+        "shell",
+        "code",
+    ]
+    assert cells[0].lines == ["Title: Example", "Accelerator: None"]
+    assert cells[2] == tutobooks.ScriptCell("markdown", ["## Setup"], 6)
+    assert cells[3].lines == ["import keras", ""]
+    assert cells[4].lines == ["pip install keras"]
+    assert cells[5] == tutobooks.ScriptCell("code", ["", "x = 1", ""], 14)
+
+
+def test_parse_script_errors():
+    with pytest.raises(ValueError, match="unknown cell tag `bash` on line 11"):
+        tutobooks.parse_script(SCRIPT.replace('"""shell', '"""bash'))
+    with pytest.raises(ValueError, match="should end with a newline"):
+        tutobooks.parse_script(SCRIPT.rstrip("\n"))
+
+
+def test_is_black_formatted_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(tutobooks, "BLACK_CACHE_DIR", tmp_path)
+    assert tutobooks.is_black_formatted("x = 1\n")
+    assert not tutobooks.is_black_formatted("x=1\n")
+    # Only the final cache entries are left behind, and they are read back.
+    assert sorted(path.read_text() for path in tmp_path.iterdir()) == ["0", "1"]
+    assert tutobooks.is_black_formatted("x = 1\n")
+
+
+def test_validate_file_reports_any_error(tmp_path):
+    assert tutobooks._validate_file(str(tmp_path / "missing.py")).startswith(
+        "FileNotFoundError: "
+    )
+    bad_path = tmp_path / "bad.py"
+    bad_path.write_bytes(b"\xff\xfe\x00")
+    assert tutobooks._validate_file(str(bad_path)) is not None
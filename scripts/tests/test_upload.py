@@ -0,0 +1,112 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+import upload
+
+
+@pytest.fixture
+def uploader(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(upload, "RETRY_BASE_DELAY", 0)
+    # `load_hash_cache` and `save_hash_cache` use the working directory.
+    monkeypatch.chdir(tmp_path)
+    with moto.mock_aws():
+        import boto3
+
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=upload.BUCKET)
+        yield upload.Uploader(client=client, workers=2)
+
+
+@pytest.fixture
+def site_dir(tmp_path):
+    site = tmp_path / "site"
+    (site / "img").mkdir(parents=True)
+    (site / "index.html").write_text("<p>Keras</p>" * 200)
+    (site / "img" / ("0" * 20 + ".png")).write_bytes(b"\x89PNG" + b"\x00" * 100)
+    return site
+
+
+def test_hash_cache_round_trip(uploader, site_dir):
+    # Big enough to be compressed, if it were treated like a text asset.
+    hash_cache = {f"page_{i}.html": "0123abcd" for i in range(200)}
+    upload.save_hash_cache(uploader, hash_cache)
+    head = uploader.client.head_object(Bucket=uploader.bucket, Key=upload.HASH_CACHE)
+    assert "ContentEncoding" not in head
+    assert upload.load_hash_cache(uploader) == hash_cache
+
+
+def test_load_gzip_encoded_hash_cache(uploader):
+    uploader.client.put_object(
+        Bucket=uploader.bucket,
+        Key=upload.HASH_CACHE,
+        Body=gzip.compress(json.dumps({"index.html": "0123abcd"}).encode()),
+        ContentEncoding="gzip",
+    )
+    assert upload.load_hash_cache(uploader) == {"index.html": "0123abcd"}
+
+
+def test_upload_dir_headers_and_hash_cache(uploader, site_dir):
+    hash_cache = upload.upload_dir(uploader, str(site_dir), hash_cache={})
+    assert sorted(hash_cache) == ["img/" + "0" * 20 + ".png", "index.html"]
+
+    head = uploader.client.head_object(Bucket=uploader.bucket, Key="index.html")
+    assert head["ContentEncoding"] == "gzip"
+    assert head["CacheControl"] == upload.HTML_CACHE_CONTROL
+    body = uploader.client.get_object(Bucket=uploader.bucket, Key="index.html")
+    assert (
+        gzip.decompress(body["Body"].read()) == (site_dir / "index.html").read_bytes()
+    )
+    head = uploader.client.head_object(
+        Bucket=uploader.bucket, Key="img/" + "0" * 20 + ".png"
+    )
+    assert head["CacheControl"] == upload.IMMUTABLE_CACHE_CONTROL
+
+    # Nothing changed: nothing is uploaded again.
+    assert upload.upload_dir(uploader, str(site_dir), hash_cache=hash_cache) == (
+        hash_cache
+    )
+    assert uploader.stats["files"] == 0
+
+
+def test_retries_and_failures(uploader, site_dir, monkeypatch):
+    import botocore.exceptions
+
+    upload_fileobj = uploader.client.upload_fileobj
+    calls = []
+
+    def flaky_upload_fileobj(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "SlowDown"}}, "PutObject"
+            )
+        return upload_fileobj(*args, **kwargs)
+
+    monkeypatch.setattr(uploader.client, "upload_fileobj", flaky_upload_fileobj)
+    assert uploader.upload_file(str(site_dir / "index.html"), "index.html")
+    assert uploader.stats["retries"] == 1
+
+    def denied_upload_fileobj(fileobj, bucket, key_name, *args, **kwargs):
+        if key_name != "index.html":
+            return upload_fileobj(fileobj, bucket, key_name, *args, **kwargs)
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": "AccessDenied"}}, "PutObject"
+        )
+
+    monkeypatch.setattr(uploader.client, "upload_fileobj", denied_upload_fileobj)
+    hash_cache = upload.upload_dir(uploader, str(site_dir), hash_cache={})
+    # Failed files are uploaded again next time.
+    assert "index.html" not in hash_cache
+    assert uploader.stats["failures"] == 1
+
+    # The failure is surfaced in the exit code, and the other files are cached.
+    assert upload.main(uploader, str(site_dir)) == 1
+    assert sorted(upload.load_hash_cache(uploader)) == ["img/" + "0" * 20 + ".png"]
@@ -0,0 +1,185 @@
+"""Content-addressed cache of executed tutobooks.
+
+A tutobook only needs to be executed again when its source or the
+environment it runs in changes. The cache key of a tutobook combines:
+
+- the content of its `.py` script,
+- the installed versions of keras, tensorflow, jax and torch,
+- the `KERAS_BACKEND` environment variable,
+- the `Accelerator:` field of its header,
+- the code that executes and exports notebooks (`tutobooks.py`,
+  `notebook_engine.py`) and the image directory the markdown refers to.
+
+Each entry is a directory `<cache_dir>/<key>/` holding the executed
+notebook (`notebook.ipynb`), the markdown (`<name>.md`), its profile
+(`profile.json`), the image outputs (`img/`) and an `entry.json` describing
+how it was produced.
+
+USAGE:
+
+python tutobook_cache.py list  # List entries, flagging stale ones
+python tutobook_cache.py evict  # Remove stale entries
+python tutobook_cache.py evict --all  # Remove all entries
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import media_store
+import tutobooks
+
+FRAMEWORKS = ("keras", "tensorflow", "jax", "torch")
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".build_cache" / "notebooks"
+
+
+def get_framework_versions():
+    versions = {}
+    for name in FRAMEWORKS:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def get_code_version():
+    h = hashlib.sha256()
+    for fname in ("tutobooks.py", "notebook_engine.py"):
+        with open(Path(__file__).parent / fname, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def get_accelerator(py):
+    header = tutobooks.parse_script(py)[0]
+    for line in header.lines:
+        if line.startswith("Accelerator: "):
+            return line[len("Accelerator: ") :]
+    return None
+
+
+class NotebookCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.versions = get_framework_versions()
+        self.code_version = get_code_version()
+
+    def get_key_inputs(self, py_path, img_dir):
+        """Everything that affects the outputs of a tutobook, except its source."""
+        py = open(py_path).read()
+        return {
+            "source": hashlib.sha256(py.encode("utf-8")).hexdigest(),
+            "versions": self.versions,
+            "backend": os.environ.get("KERAS_BACKEND"),
+            "accelerator": get_accelerator(py),
+            "code_version": self.code_version,
+            "img_dir": str(img_dir),
+        }
+
+    def get_key(self, key_inputs):
+        content = json.dumps(key_inputs, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def restore(self, key, md_path, img_dir):
+        """Copy the outputs of a cached tutobook. Returns False on a miss."""
+        entry_dir = self.cache_dir / key
+        name = Path(md_path).stem
+        if not os.path.exists(entry_dir / "entry.json"):
+            return False
+        shutil.copyfile(entry_dir / (name + ".md"), md_path)
+        if os.path.exists(entry_dir / "profile.json"):
+            shutil.copyfile(
+                entry_dir / "profile.json", tutobooks.get_profile_path(md_path)
+            )
+        shutil.copytree(
+            entry_dir / "img",
+            Path(img_dir) / name,
+            dirs_exist_ok=True,
+            copy_function=media_store.link_or_copy,
+        )
+        return True
+
+    def store(self, key, key_inputs, name, executed_nb_path, md_path, img_dir):
+        """Save the outputs of a freshly executed tutobook."""
+        entry_dir = self.cache_dir / key
+        tmp_dir = self.cache_dir / (key + ".tmp")
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        md_name = Path(md_path).stem
+        shutil.copyfile(executed_nb_path, tmp_dir / "notebook.ipynb")
+        shutil.copyfile(md_path, tmp_dir / (md_name + ".md"))
+        profile_path = tutobooks.get_profile_path(md_path)
+        if os.path.exists(profile_path):
+            shutil.copyfile(profile_path, tmp_dir / "profile.json")
+        src_img_dir = Path(img_dir) / md_name
+        if os.path.exists(src_img_dir):
+            shutil.copytree(
+                src_img_dir, tmp_dir / "img", copy_function=media_store.link_or_copy
+            )
+        else:
+            os.makedirs(tmp_dir / "img")
+        entry = {"name": name, "created": time.time(), "key_inputs": key_inputs}
+        with open(tmp_dir / "entry.json", "w") as f:
+            f.write(json.dumps(entry, indent=2, sort_keys=True))
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+
+    def list_entries(self):
+        """Return `(key, entry)` pairs, most recent first."""
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry_path = self.cache_dir / key / "entry.json"
+            if os.path.exists(entry_path):
+                with open(entry_path) as f:
+                    entries.append((key, json.loads(f.read())))
+        entries.sort(key=lambda item: -item[1]["created"])
+        return entries
+
+    def get_stale_keys(self):
+        """Entries produced with other library or code versions, or
+        superseded by a more recent entry for the same tutobook."""
+        stale = []
+        seen_names = set()
+        for key, entry in self.list_entries():
+            key_inputs = entry["key_inputs"]
+            if (
+                entry["name"] in seen_names
+                or key_inputs["versions"] != self.versions
+                or key_inputs["code_version"] != self.code_version
+            ):
+                stale.append(key)
+            seen_names.add(entry["name"])
+        return stale
+
+    def evict(self, keys):
+        for key in keys:
+            shutil.rmtree(self.cache_dir / key)
+        print(f"Evicted {len(keys)} cached tutobooks from {self.cache_dir}")
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else None
+    if cmd not in {"list", "evict"}:
+        raise ValueError("Specify a command: either `list` or `evict [--all]`.")
+    cache = NotebookCache()
+    if cmd == "list":
+        stale = set(cache.get_stale_keys())
+        for key, entry in cache.list_entries():
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created"]))
+            status = " (stale)" if key in stale else ""
+            print(f"{key[:12]}  {created}  {entry['name']}{status}")
+    else:
+        if "--all" in sys.argv:
+            cache.evict([key for key, _ in cache.list_entries()])
+        else:
+            cache.evict(cache.get_stale_keys())
@@ -0,0 +1,321 @@
+"""Static analysis index of all tutobooks.
+
+Every guide and example script is parsed once (with `tutobooks.parse_script`
+and `ast`, without executing anything) and summarized in a SQLite database,
+`.build_cache/tutobook_index.sqlite`:
+
+- `tutobooks`: name, path, source hash, lines of code, number of code and
+  text cells and declared accelerator of each tutobook.
+- `imports`: the modules imported by each tutobook.
+- `apis`: the Keras APIs it uses, as fully qualified names (e.g.
+  `keras.layers.MultiHeadAttention`, whichever way it was imported).
+- `datasets`: the datasets it downloads (`keras.datasets`,
+  `tensorflow_datasets.load`, `keras.utils.get_file` URLs, `wget`/`curl`
+  shell commands, Hugging Face `load_dataset`).
+
+Scripts are only parsed again when their content changes.
+
+USAGE:
+
+python tutobooks.py index  # Build or update the index
+python tutobooks.py index --uses keras.layers.MultiHeadAttention
+"""
+
+import ast
+import hashlib
+import multiprocessing
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+import tutobooks
+
+DEFAULT_INDEX_PATH = (
+    Path(__file__).parent.parent / ".build_cache" / "tutobook_index.sqlite"
+)
+# Root packages whose APIs are indexed.
+KERAS_PACKAGES = ("keras", "keras_hub", "keras_cv", "keras_nlp", "keras_tuner")
+# `tf.keras.*` and `tf_keras.*` are recorded as `keras.*`.
+KERAS_ALIASES = {"tensorflow.keras": "keras", "tf_keras": "keras"}
+DOWNLOAD_COMMANDS = ("wget", "curl", "gdown", "kaggle")
+
+_URL = re.compile(r"https?://[^\s'\"\)]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tutobooks (
+    name TEXT PRIMARY KEY,
+    path TEXT,
+    source_hash TEXT,
+    loc INTEGER,
+    num_code_cells INTEGER,
+    num_text_cells INTEGER,
+    accelerator TEXT
+);
+CREATE TABLE IF NOT EXISTS imports (name TEXT, module TEXT);
+CREATE TABLE IF NOT EXISTS apis (name TEXT, api TEXT);
+CREATE TABLE IF NOT EXISTS datasets (name TEXT, dataset TEXT);
+CREATE INDEX IF NOT EXISTS imports_module ON imports (module);
+CREATE INDEX IF NOT EXISTS apis_api ON apis (api);
+CREATE INDEX IF NOT EXISTS datasets_dataset ON datasets (dataset);
+"""
+
+
+def get_tutobook_name(py_path):
+    """e.g. `examples/nlp/addition_rnn.py` -> `nlp/addition_rnn`."""
+    py_path = Path(py_path)
+    return py_path.parent.name + "/" + py_path.stem
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("_", "\\_").replace("%", "\\%")
+
+
+def normalize_api(name):
+    for alias, target in KERAS_ALIASES.items():
+        if name == alias or name.startswith(alias + "."):
+            return target + name[len(alias) :]
+    return name
+
+
+class APIVisitor(ast.NodeVisitor):
+    """Collects imported modules, Keras APIs and datasets of a script."""
+
+    def __init__(self):
+        # Maps local names to the fully qualified names they are bound to.
+        self.aliases = {}
+        self.imports = set()
+        self.apis = set()
+        self.datasets = set()
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.add(alias.name)
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+            else:
+                root = alias.name.split(".")[0]
+                self.aliases[root] = root
+
+    def visit_ImportFrom(self, node):
+        if node.level or not node.module:
+            return
+        self.imports.add(node.module)
+        for alias in node.names:
+            if alias.name == "*":
+                continue
+            qualified_name = node.module + "." + alias.name
+            self.aliases[alias.asname or alias.name] = qualified_name
+            self.record_api(qualified_name)
+
+    def resolve(self, node):
+        """Fully qualified name of a `Name` or `Attribute` chain, or None."""
+        attrs = []
+        while isinstance(node, ast.Attribute):
+            attrs.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name) or node.id not in self.aliases:
+            return None
+        return ".".join([self.aliases[node.id]] + attrs[::-1])
+
+    def record_api(self, name):
+        name = normalize_api(name)
+        if name.split(".")[0] in KERAS_PACKAGES:
+            self.apis.add(name)
+        if name.startswith("keras.datasets.") and name.count(".") >= 2:
+            self.datasets.add(".".join(name.split(".")[:3]))
+        return name
+
+    def visit_Attribute(self, node):
+        name = self.resolve(node)
+        if name is None:
+            self.generic_visit(node)
+        else:
+            self.record_api(name)
+
+    def visit_Name(self, node):
+        if node.id in self.aliases:
+            self.record_api(self.aliases[node.id])
+
+    def visit_Call(self, node):
+        name = self.resolve(node.func)
+        if name is not None:
+            name = normalize_api(name)
+            if name == "tensorflow_datasets.load":
+                dataset = get_argument(node, 0, "name")
+                if dataset:
+                    self.datasets.add("tfds:" + dataset.split(":")[0].split("/")[0])
+            elif name == "datasets.load_dataset":
+                dataset = get_argument(node, 0, "path")
+                if dataset:
+                    self.datasets.add("huggingface:" + dataset)
+            elif name.endswith("utils.get_file"):
+                origin = get_argument(node, 1, "origin")
+                if origin:
+                    self.datasets.add(origin)
+        self.generic_visit(node)
+
+
+def get_argument(node, position, keyword):
+    """Value of a string literal argument of a call, or None."""
+    value = None
+    if len(node.args) > position:
+        value = node.args[position]
+    for kw in node.keywords:
+        if kw.arg == keyword:
+            value = kw.value
+    if isinstance(value, ast.Constant) and isinstance(value.value, str):
+        return value.value
+    return None
+
+
+def analyze_tutobook(py_path):
+    """Return the index record of a tutobook script."""
+    with open(py_path, "rb") as f:
+        content = f.read()
+    with open(py_path) as f:
+        cells = tutobooks.parse_script(f.read())
+    record = {
+        "name": get_tutobook_name(py_path),
+        "path": str(py_path),
+        "source_hash": hashlib.sha256(content).hexdigest(),
+        "loc": 0,
+        "num_code_cells": 0,
+        "num_text_cells": 0,
+        "accelerator": None,
+    }
+    visitor = APIVisitor()
+    for cell in cells:
+        if cell.cell_type == "header":
+            for line in cell.lines:
+                if line.startswith("Accelerator: "):
+                    record["accelerator"] = line[len("Accelerator: ") :]
+        elif cell.cell_type == "code":
+            record["num_code_cells"] += 1
+            record["loc"] += tutobooks._count_locs(cell.lines)
+            try:
+                visitor.visit(ast.parse("\n".join(cell.lines)))
+            except SyntaxError as e:
+                print(f"Could not parse the code of {py_path}: {e}")
+        elif cell.cell_type == "shell":
+            for line in cell.lines:
+                if line.strip().split(" ")[0] in DOWNLOAD_COMMANDS:
+                    visitor.datasets.update(_URL.findall(line))
+        else:
+            record["num_text_cells"] += 1
+    record["imports"] = sorted(visitor.imports)
+    record["apis"] = sorted(visitor.apis)
+    record["datasets"] = sorted(visitor.datasets)
+    return record
+
+
+class TutobookIndex:
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def get_source_hashes(self):
+        return dict(self.db.execute("SELECT name, source_hash FROM tutobooks"))
+
+    def update(self, py_paths, processes=None):
+        """Index new and modified scripts, and drop the deleted ones.
+
+        Returns the names of the tutobooks that were (re)indexed.
+        """
+        known_hashes = self.get_source_hashes()
+        to_index = []
+        for py_path in py_paths:
+            with open(py_path, "rb") as f:
+                source_hash = hashlib.sha256(f.read()).hexdigest()
+            if known_hashes.get(get_tutobook_name(py_path)) != source_hash:
+                to_index.append(py_path)
+        if len(to_index) > 1:
+            with multiprocessing.Pool(processes or os.cpu_count()) as pool:
+                records = pool.map(analyze_tutobook, to_index)
+        else:
+            records = [analyze_tutobook(py_path) for py_path in to_index]
+
+        names = set(get_tutobook_name(py_path) for py_path in py_paths)
+        with self.db:
+            for name in set(known_hashes) - names:
+                self.delete(name)
+            for record in records:
+                self.delete(record["name"])
+                self.db.execute(
+                    "INSERT INTO tutobooks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record["name"],
+                        record["path"],
+                        record["source_hash"],
+                        record["loc"],
+                        record["num_code_cells"],
+                        record["num_text_cells"],
+                        record["accelerator"],
+                    ),
+                )
+                for table, column in (
+                    ("imports", "module"),
+                    ("apis", "api"),
+                    ("datasets", "dataset"),
+                ):
+                    self.db.executemany(
+                        f"INSERT INTO {table} (name, {column}) VALUES (?, ?)",
+                        [(record["name"], value) for value in record[table]],
+                    )
+        print(
+            f"Indexed {len(records)} tutobooks "
+            f"({len(py_paths) - len(records)} unchanged) in {self.path}"
+        )
+        return [record["name"] for record in records]
+
+    def delete(self, name):
+        for table in ("tutobooks", "imports", "apis", "datasets"):
+            self.db.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+    def find_users(self, api):
+        """Tutobooks using `api` or anything under it (e.g. `keras.ops`)."""
+        api = normalize_api(api)
+        rows = self.db.execute(
+            "SELECT DISTINCT name FROM apis WHERE api = ? OR api LIKE ? ESCAPE '\\' "
+            "ORDER BY name",
+            (api, escape_like(api) + ".%"),
+        )
+        return [row[0] for row in rows]
+
+    def find_importers(self, module):
+        rows = self.db.execute(
+            "SELECT DISTINCT name FROM imports "
+            "WHERE module = ? OR module LIKE ? ESCAPE '\\' ORDER BY name",
+            (module, escape_like(module) + ".%"),
+        )
+        return [row[0] for row in rows]
+
+    def get_tutobooks_to_rerun(self, apis):
+        """Tutobooks to execute again after a change to any of `apis`."""
+        names = set()
+        for api in apis:
+            names.update(self.find_users(api))
+        return sorted(names)
+
+    def get_record(self, name):
+        cursor = self.db.execute("SELECT * FROM tutobooks WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        record = dict(zip([column[0] for column in cursor.description], row))
+        for table, column in (
+            ("imports", "module"),
+            ("apis", "api"),
+            ("datasets", "dataset"),
+        ):
+            rows = self.db.execute(
+                f"SELECT {column} FROM {table} WHERE name = ? ORDER BY {column}",
+                (name,),
+            )
+            record[table] = [row[0] for row in rows]
+        return record
@@ -0,0 +1,92 @@
+"""Checkpointing of `make_tutobook_sources` runs.
+
+Tutobooks are generated into a staging area (`<dir>/staging/md/` and
+`<dir>/staging/img/`), and each one is swapped into `<dir>/md/` and
+`<dir>/img/` as soon as it is done, so a crash never leaves a half-written
+tutobook behind, nor loses the ones already generated.
+
+Each finished tutobook is then recorded in a run journal: a JSON lines
+file with one `{"name": ..., "source": ...}` entry per tutobook, where
+`source` is the hash of its script. A run started with `--resume` skips the
+tutobooks recorded in the journal with an unchanged script.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+
+def get_source_hash(py_path):
+    with open(py_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def swap_in(staged_path, target_path):
+    """Move a staged file or directory to `target_path`, replacing it."""
+    if not os.path.isdir(staged_path):
+        os.replace(staged_path, target_path)
+        return
+    # Directories can't be replaced in one rename: move the old one away
+    # first, so that `target_path` is missing for as short a time as possible.
+    old_path = str(target_path) + ".old"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(target_path):
+        os.replace(target_path, old_path)
+    os.replace(staged_path, target_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+class RunJournal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = {}
+        if resume:
+            self.completed = self.load()
+            print(f"Resuming run: {len(self.completed)} tutobooks already done")
+            self.end_truncated_line()
+        else:
+            parent = os.path.dirname(path)
+            if parent and not os.path.exists(parent):
+                os.makedirs(parent)
+            with open(path, "w") as f:
+                f.write(json.dumps({"started": time.time()}) + "\n")
+
+    def load(self):
+        """Return the source hash of each completed tutobook."""
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Truncated by a crash.
+                if "name" in entry:
+                    completed[entry["name"]] = entry["source"]
+        return completed
+
+    def end_truncated_line(self):
+        """Terminate a last line cut by a crash, so that new entries aren't
+        appended to it."""
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def is_done(self, job):
+        return self.completed.get(job["name"]) == get_source_hash(job["py_path"])
+
+    def record(self, job):
+        source = get_source_hash(job["py_path"])
+        self.completed[job["name"]] = source
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"name": job["name"], "source": source}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
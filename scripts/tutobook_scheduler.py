@@ -0,0 +1,246 @@
+"""Concurrent execution of tutobooks on a bounded pool of worker processes.
+
+Each tutobook (a guide or an example) is one job:
+
+{
+    'name': Unique name of the job, e.g. `nlp/addition_rnn`,
+    'py_path': Path of the tutobook script,
+    'nb_path': Path of the notebook to generate,
+    'md_path': Path of the markdown file to generate,
+    'img_dir': Directory where the image outputs are saved,
+    'executed_nb_path': Optional path where the executed notebook is saved,
+    'smoke': Optional, whether to run in smoke mode (see `smoke_prelude`),
+    'media_store': Optional `media_store.MediaStore` for the image outputs,
+}
+
+Jobs run in separate worker processes, each in its own temporary working
+directory, with a capped number of threads (and optionally a capped amount
+of memory) for the notebook kernels. Each worker keeps its kernels warm
+across jobs (see `notebook_engine`). The jobs that took the longest on
+previous runs are started first. A failed job doesn't stop the others:
+all results are gathered in a summary report.
+"""
+
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+import notebook_engine
+import tutobooks
+
+# Environment variables capping the threads used by each notebook kernel.
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+)
+DEFAULT_THREADS_PER_JOB = 4
+
+
+def load_runtimes(runtimes_path):
+    """Load the recorded runtime (in seconds) of each job name."""
+    if runtimes_path is None or not os.path.exists(runtimes_path):
+        return {}
+    with open(runtimes_path) as f:
+        return json.loads(f.read())
+
+
+def save_json(path, content):
+    parent = os.path.dirname(path)
+    if parent and not os.path.exists(parent):
+        os.makedirs(parent)
+    with open(path, "w") as f:
+        f.write(json.dumps(content, indent=2, sort_keys=True))
+
+
+def sort_jobs(jobs, runtimes):
+    """Longest jobs first. Jobs without a recorded runtime go first."""
+    return sorted(
+        jobs, key=lambda job: (-runtimes.get(job["name"], float("inf")), job["name"])
+    )
+
+
+def init_worker(threads_per_job, memory_limit_gb):
+    # Inherited by the notebook kernels started by this worker.
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads_per_job)
+    if memory_limit_gb:
+        limit = int(memory_limit_gb * 1024**3)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_job(job):
+    """Execute a single tutobook. Runs in a worker process."""
+    working_dir = tempfile.mkdtemp(prefix="tutobook_")
+    start = time.time()
+    error = None
+    cell_error = None
+    try:
+        tutobooks.py_to_md(
+            job["py_path"],
+            job["nb_path"],
+            job["md_path"],
+            job["img_dir"],
+            working_dir=working_dir,
+            executed_nb_path=job.get("executed_nb_path"),
+            smoke=job.get("smoke", False),
+            store=job.get("media_store"),
+        )
+    except notebook_engine.NotebookExecutionError as e:
+        error = traceback.format_exc()
+        cell_error = e.to_dict()
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        shutil.rmtree(working_dir, ignore_errors=True)
+    return {
+        "name": job["name"],
+        "success": error is None,
+        "runtime": time.time() - start,
+        "error": error,
+        "cell_error": cell_error,
+    }
+
+
+def run_jobs(
+    jobs,
+    num_workers=None,
+    threads_per_job=DEFAULT_THREADS_PER_JOB,
+    memory_limit_gb=None,
+    runtimes_path=None,
+    report_path=None,
+    on_result=None,
+):
+    """Execute tutobook jobs concurrently.
+
+    Args:
+        jobs: List of job dicts (see module docstring).
+        num_workers: Number of concurrent jobs. Defaults to the CPU count
+            divided by `threads_per_job`.
+        threads_per_job: Number of threads each notebook kernel may use.
+        memory_limit_gb: Optional cap on the address space of each job.
+        runtimes_path: JSON file of recorded job runtimes, used to schedule
+            the longest jobs first and updated with the new runtimes.
+        report_path: Optional path of the JSON summary report.
+        on_result: Optional function called with each job and its result,
+            as soon as the job is done (e.g. to checkpoint the run).
+
+    Returns:
+        The list of job results, in the order of `jobs`.
+    """
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 1) // threads_per_job)
+    runtimes = load_runtimes(runtimes_path)
+    ordered_jobs = sort_jobs(jobs, runtimes)
+    print(f"Running {len(jobs)} tutobooks with {num_workers} workers")
+
+    jobs_by_name = {job["name"]: job for job in jobs}
+    results = {}
+    start = time.time()
+    pool = multiprocessing.Pool(
+        num_workers,
+        initializer=init_worker,
+        initargs=(threads_per_job, memory_limit_gb),
+    )
+    try:
+        for result in pool.imap_unordered(run_job, ordered_jobs):
+            results[result["name"]] = result
+            status = "done" if result["success"] else "FAILED"
+            print(
+                f"[{len(results)}/{len(jobs)}] {result['name']} {status} "
+                f"in {result['runtime']:.0f}s"
+            )
+            if result["success"]:
+                runtimes[result["name"]] = result["runtime"]
+            if on_result is not None:
+                on_result(jobs_by_name[result["name"]], result)
+        # Let the workers exit normally, so that they shut down their warm
+        # kernels (`terminate()` would kill them and orphan the kernels).
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if runtimes_path is not None:
+        save_json(runtimes_path, runtimes)
+
+    results = [results[job["name"]] for job in jobs]
+    report = make_report(results, time.time() - start)
+    if report_path is not None:
+        save_json(report_path, report)
+    print_report(report)
+    return results
+
+
+def run_tutobooks(py_paths, smoke=False, num_workers=None):
+    """Execute tutobook scripts without touching their published outputs.
+
+    Notebooks, markdown and images are written to a temporary directory
+    that is deleted afterwards. Only the report is kept (in `.build_cache/`).
+    In smoke mode, tutobooks are downscaled to run in minutes on CPU (see
+    `smoke_prelude`).
+    """
+    cache_dir = Path(__file__).parent.parent / ".build_cache"
+    prefix = "tutobook_smoke" if smoke else "tutobook_run"
+    output_dir = Path(tempfile.mkdtemp(prefix=prefix + "_"))
+    jobs = []
+    for py_path in py_paths:
+        py_path = Path(py_path)
+        name = py_path.parent.name + "/" + py_path.stem
+        job_dir = output_dir / py_path.parent.name
+        os.makedirs(job_dir / "img", exist_ok=True)
+        jobs.append(
+            {
+                "name": name,
+                "py_path": py_path,
+                "nb_path": job_dir / (py_path.stem + ".ipynb"),
+                "md_path": job_dir / (py_path.stem + ".md"),
+                "img_dir": job_dir / "img",
+                "smoke": smoke,
+            }
+        )
+    try:
+        return run_jobs(
+            jobs,
+            num_workers=num_workers,
+            runtimes_path=cache_dir / (prefix + "_runtimes.json"),
+            report_path=cache_dir / (prefix + "_report.json"),
+        )
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def make_report(results, wall_time):
+    return {
+        "wall_time": wall_time,
+        "num_succeeded": sum(result["success"] for result in results),
+        "num_failed": sum(not result["success"] for result in results),
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(
+        f"Ran {len(report['results'])} tutobooks in {report['wall_time']:.0f}s: "
+        f"{report['num_succeeded']} succeeded, {report['num_failed']} failed."
+    )
+    for result in report["results"]:
+        if not result["success"]:
+            cell_error = result["cell_error"]
+            if cell_error:
+                print(
+                    f"...FAILED {result['name']} at cell {cell_error['cell_index']}: "
+                    f"{cell_error['ename']}: {cell_error['evalue']}"
+                )
+            else:
+                last_line = result["error"].strip().split("\n")[-1]
+                print(f"...FAILED {result['name']}: {last_line}")
@@ -59,19 +59,67 @@ Open the generated `preview.ipynb` and make sure it looks like what
 you expect. If not, keep editing `your_example.py` until it does.
 
 Finally, submit a PR adding `examples/your_example.py`.
+
+To check the format of every guide and example at once, run:
+
+```
+python tutobooks.py validate_all
+```
+
+Each generated md file comes with a `.profile.json` file recording the
+wall time, CPU time and peak memory of every code cell. To find the
+slowest guides, examples and cells, run:
+
+```
+python tutobooks.py profile_report
+```
+
+To check that guides and examples run end to end without training them
+for real, run them in smoke mode (see `smoke_prelude.py`). Published
+outputs are left untouched:
+
+```
+python tutobooks.py run_all --smoke [../examples/vision/*.py]
+```
+
+To index the modules, Keras APIs and datasets used by every guide and
+example (see `tutobook_index.py`), and list the ones using an API, run:
+
+```
+python tutobooks.py index --uses keras.layers.MultiHeadAttention
+```
 """
 
 import os
 import sys
 import json
 import copy
-import random
+import collections
+import glob
+import hashlib
 import shutil
 import tempfile
+import multiprocessing
 from pathlib import Path
 
-TIMEOUT = 12 * 60 * 60  # 12 hours
+import black
+
+import media_store
+import notebook_engine
+
+TIMEOUT = 12 * 60 * 60  # 12 hours, per cell
 MAX_LOC = 350
+BLACK_CACHE_DIR = Path(__file__).parent.parent / ".build_cache" / "black"
+SMOKE_PRELUDE_PATH = str(Path(__file__).parent.resolve() / "smoke_prelude.py")
+# Runs `smoke_prelude.py` in the kernel, outside of the user namespace.
+SMOKE_PRELUDE = (
+    f"exec(compile(open({SMOKE_PRELUDE_PATH!r}).read(), {SMOKE_PRELUDE_PATH!r}, "
+    "'exec'), {'__name__': 'smoke_prelude'})"
+)
+
+# A cell of a tutobook script. `lineno` is the 1-based line number of its
+# first line (the opening fence, for text cells).
+ScriptCell = collections.namedtuple("ScriptCell", ["cell_type", "lines", "lineno"])
 
 
 def nb_to_py(nb_path, py_path):
@@ -101,14 +149,12 @@ def nb_to_py(nb_path, py_path):
             py += '"""\n'
             py += "".join(cell["source"]) + "\n"
             py += '"""\n\n'
-    # Save file
-    f = open(py_path, "w")
-    f.write(py)
-    f.close()
     # Format file with Black
-    os.system("black " + py_path)
+    try:
+        py = black.format_str(py, mode=black.Mode())
+    except black.InvalidInput as e:
+        print(f"Could not format {py_path} with `black`: {e}")
     # Shorten lines
-    py = open(py_path).read()
     try:
         py = _shorten_lines(py)
     finally:
@@ -117,14 +163,17 @@ def nb_to_py(nb_path, py_path):
         f.close()
 
 
-def py_to_nb(py_path, nb_path, fill_outputs=False):
+def py_to_nb(py_path, nb_path, fill_outputs=False, max_loc=None):
+    """Convert a tutobook script to a notebook, and return the notebook."""
+    if max_loc is None:
+        max_loc = MAX_LOC
     f = open(py_path)
     py = f.read()
     f.close()
     validate(py)
 
-    header, _, py, tag = _get_next_script_element(py)
-    attributes = _parse_header(header)
+    script_cells = parse_script(py)
+    attributes = _parse_header("\n".join(script_cells[0].lines))
     cells = []
     loc = 0
     # Write first header cell
@@ -141,11 +190,9 @@ def py_to_nb(py_path, nb_path, fill_outputs=False):
         "metadata": {"colab_type": "text"},
     }
     cells.append(header_cell)
-    while py:
-        e, cell_type, py, tag = _get_next_script_element(py)
-        lines = e.split("\n")
-
-        if all(l == "" for l in lines):
+    for script_cell in script_cells[1:]:
+        lines = script_cell.lines
+        if script_cell.cell_type == "invisible" or all(l == "" for l in lines):
             continue
 
         if lines and not lines[0]:
@@ -156,10 +203,11 @@ def py_to_nb(py_path, nb_path, fill_outputs=False):
             source = source[:-1]
         if source:
             source[-1] = source[-1].rstrip()
-        if tag == "shell":
+        cell_type = script_cell.cell_type
+        if cell_type == "shell":
             source = ["!" + l for l in source]
             cell_type = "code"
-        if tag != "invisible" and source:
+        if source:
             cell = {"cell_type": cell_type, "source": source}
             if cell_type == "code":
                 cell["outputs"] = []
@@ -175,9 +223,9 @@ def py_to_nb(py_path, nb_path, fill_outputs=False):
     notebook["metadata"]["colab"]["name"] = str(py_path).split("/")[-1][:-3]
     notebook["metadata"]["accelerator"] = attributes["accelerator"]
     notebook["cells"] = cells
-    if loc > MAX_LOC:
+    if loc > max_loc:
         raise ValueError(
-            f"Found {loc} lines of code, but expected fewer than {MAX_LOC}"
+            f"Found {loc} lines of code, but expected fewer than {max_loc}"
         )
 
     f = open(nb_path, "w")
@@ -185,103 +233,149 @@ def py_to_nb(py_path, nb_path, fill_outputs=False):
     f.close()
     if fill_outputs:
         print("Generating ipynb")
-        parent_dir = Path(nb_path).parent
-        current_files = os.listdir(parent_dir)
+        nb = notebook_engine.read_notebook(nb_path)
+        working_dir = tempfile.mkdtemp(prefix="tutobook_")
         try:
-            os.system(
-                "jupyter nbconvert --to notebook --execute --debug "
-                + str(nb_path)
-                + " --inplace"
-                + " --ExecutePreprocessor.timeout="
-                + str(TIMEOUT)
+            notebook_engine.execute_notebook(
+                nb,
+                working_dir,
+                name=notebook["metadata"]["colab"]["name"],
+                timeout=TIMEOUT,
             )
         finally:
-            new_files = os.listdir(parent_dir)
-            for fname in new_files:
-                if fname not in current_files:
-                    fpath = parent_dir / fname
-                    if os.path.isdir(fpath):
-                        print("Removing created folder:", fname)
-                        shutil.rmtree(fpath)
-                    else:
-                        print("Removing created file:", fname)
-                        os.remove(fpath)
-
-
-def nb_to_md(nb_path, md_path, img_dir, working_dir=None):
-    img_exts = ("png", "jpg", "jpeg")
+            shutil.rmtree(working_dir)
+        notebook_engine.write_notebook(nb, nb_path)
+        return nb
+    return notebook
+
+
+def nb_to_md(
+    nb_path,
+    md_path,
+    img_dir,
+    working_dir=None,
+    executed_nb_path=None,
+    smoke=False,
+    store=None,
+):
     # Assumes an already populated notebook.
+    # Images are saved through `store` (a `media_store.MediaStore`).
+    if store is None:
+        store = media_store.MediaStore()
     assert str(md_path).endswith(".md")
-    current_dir = os.getcwd()
     original_img_dir = str(img_dir)
     if original_img_dir.endswith("/"):
         original_img_dir = original_img_dir[:-1]
-    img_dir = os.path.abspath(img_dir)
-    nb_path = os.path.abspath(nb_path)
-    nb_fname = str(nb_path).split(os.path.sep)[-1]
+    md_name = str(md_path).split("/")[-1][:-3]
 
     del_working_dir = False
     if working_dir is None:
         del_working_dir = True
-        working_dir = "tmp_" + str(random.randint(1e6, 1e7))
+        working_dir = tempfile.mkdtemp(prefix="tutobook_")
     if not os.path.exists(working_dir):
         os.makedirs(working_dir)
     print("Using working_dir:", working_dir)
 
-    os.chdir(working_dir)
-    shutil.copyfile(nb_path, nb_fname)
-
-    md_name = str(md_path).split("/")[-1][:-3]
-    target_md = md_name + ".md"
-    img_dir = Path(img_dir) / md_name
-    if not os.path.exists(img_dir):
-        os.makedirs(img_dir)
-
-    os.system(
-        "jupyter nbconvert --to markdown --execute --debug "
-        + nb_fname
-        + " --output "
-        + target_md
-        + " --ExecutePreprocessor.timeout="
-        + str(TIMEOUT)
+    nb = notebook_engine.read_notebook(nb_path)
+    try:
+        profile = notebook_engine.execute_notebook(
+            nb,
+            working_dir,
+            name=md_name,
+            timeout=TIMEOUT,
+            prelude=SMOKE_PRELUDE if smoke else None,
+        )
+    finally:
+        if del_working_dir:
+            shutil.rmtree(working_dir)
+    if executed_nb_path is not None:
+        notebook_engine.write_notebook(nb, executed_nb_path)
+    md_content = notebook_engine.export_markdown(
+        nb, md_name, Path(img_dir) / md_name, media_store=store
     )
-    if os.path.exists(md_name + ".md"):
-        success = True
-        tmp_img_dir = md_name + "_files"
-        if os.path.exists(tmp_img_dir):
-            for fname in os.listdir(tmp_img_dir):
-                if fname.endswith(img_exts):
-                    src = Path(tmp_img_dir) / fname
-                    target = Path(img_dir) / fname
-                    print("copy", src, "to", target)
-                    shutil.copyfile(src, target)
-
-        os.chdir(current_dir)
-        md_content = open(Path(working_dir) / (md_name + ".md")).read()
-        for ext in img_exts:
-            md_content = md_content.replace(
-                "![" + ext + "](" + md_name + "_files",
-                "![" + ext + "](" + original_img_dir + "/" + md_name,
-            )
-        md_content = _make_output_code_blocks(md_content)
-        open(md_path, "w").write(md_content)
-    else:
-        success = False
-        os.chdir(current_dir)
+    for ext in notebook_engine.IMG_EXTS:
+        md_content = md_content.replace(
+            "![" + ext + "](" + md_name + "_files",
+            "![" + ext + "](" + original_img_dir + "/" + md_name,
+        )
+    md_content = _make_output_code_blocks(md_content)
+    open(md_path, "w").write(md_content)
+    save_profile(md_name, nb, profile, get_profile_path(md_path))
+
 
-    if del_working_dir:
-        shutil.rmtree(working_dir)
+def get_profile_path(md_path):
+    """Path of the JSON profile saved next to a tutobook md file."""
+    return Path(md_path).with_suffix(".profile.json")
 
-    if not success:
-        raise RuntimeError(
-            "An error was encountered when attempting to run the notebook. "
-            "See logs for details."
+
+def save_profile(name, nb, cell_profiles, profile_path):
+    cells = []
+    for cell_profile in cell_profiles:
+        source = nb.cells[cell_profile["index"]].source.strip()
+        cells.append(dict(cell_profile, source=source.split("\n")[0]))
+    peak_rss = [cell["peak_rss"] for cell in cells if cell["peak_rss"]]
+    profile = {
+        "name": name,
+        "wall_time": sum(cell["wall_time"] for cell in cells),
+        "cpu_time": sum(cell["cpu_time"] for cell in cells),
+        "peak_rss": max(peak_rss) if peak_rss else None,
+        "cells": cells,
+    }
+    with open(profile_path, "w") as f:
+        f.write(json.dumps(profile, indent=1))
+
+
+def profile_report(profile_paths, top=20):
+    """Print the slowest tutobooks and the slowest cells across all of them."""
+    profiles = []
+    for profile_path in profile_paths:
+        with open(profile_path) as f:
+            profiles.append(json.loads(f.read()))
+
+    def format_rss(peak_rss):
+        return "?" if peak_rss is None else f"{peak_rss / 1024**2:.0f}MB"
+
+    print(f"Slowest tutobooks (out of {len(profiles)}):")
+    profiles.sort(key=lambda profile: -profile["wall_time"])
+    for profile in profiles[:top]:
+        print(
+            f"{profile['wall_time']:8.1f}s wall {profile['cpu_time']:8.1f}s cpu "
+            f"{format_rss(profile['peak_rss']):>8} peak  {profile['name']}"
+        )
+
+    cells = [
+        (cell, profile["name"]) for profile in profiles for cell in profile["cells"]
+    ]
+    print(f"Slowest cells (out of {len(cells)}):")
+    cells.sort(key=lambda item: -item[0]["wall_time"])
+    for cell, name in cells[:top]:
+        print(
+            f"{cell['wall_time']:8.1f}s wall {cell['cpu_time']:8.1f}s cpu "
+            f"{format_rss(cell['peak_rss']):>8} peak  "
+            f"{name}[{cell['index']}]: {cell['source'][:60]}"
         )
 
 
-def py_to_md(py_path, nb_path, md_path, img_dir, working_dir=None):
+def py_to_md(
+    py_path,
+    nb_path,
+    md_path,
+    img_dir,
+    working_dir=None,
+    executed_nb_path=None,
+    smoke=False,
+    store=None,
+):
     py_to_nb(py_path, nb_path, fill_outputs=False)
-    nb_to_md(nb_path, md_path, img_dir, working_dir=working_dir)
+    nb_to_md(
+        nb_path,
+        md_path,
+        img_dir,
+        working_dir=working_dir,
+        executed_nb_path=executed_nb_path,
+        smoke=smoke,
+        store=store,
+    )
 
 
 def validate(py):
@@ -322,33 +416,23 @@ def validate(py):
             f"Accelerator field content must be one of: {accelerator_options}. "
             f"Received: accelerator={accelerator}"
         )
-    for i, line in enumerate(lines):
+    for i, line in enumerate(lines, 1):
         if line.startswith('"""') and line.endswith('"""') and len(line) > 3:
             raise ValueError(
                 'Do not use single line `"""`-fenced comments. '
                 "Encountered at line %d" % (i,)
             )
-    for i, line in enumerate(lines):
+    for i, line in enumerate(lines, 1):
         if line.endswith(" "):
             raise ValueError("Found trailing space on line %d; line: `%s`" % (i, line))
     # Validate style with black
-
-    tmp = tempfile.gettempdir()
-    fpath = os.path.join(tmp, str(random.randint(1e6, 1e7)) + ".py")
-    f = open(fpath, "w")
-    pre_formatting = "\n".join(lines)
-    f.write(pre_formatting)
-    f.close()
-    os.system("black " + fpath)
-    f = open(fpath)
-    formatted = f.read()
-    f.close()
-    os.remove(fpath)
-    if formatted != pre_formatting:
+    if not is_black_formatted("\n".join(lines)):
         raise ValueError(
             "Your python file did not follow `black` conventions. "
             "Run `black your_file.py` to autoformat it."
         )
+    # Validate cell tags.
+    parse_script(py)
 
     # Extra checks.
     if "//arxiv.org/pdf/" in py:
@@ -357,17 +441,63 @@ def validate(py):
         )
 
 
+def is_black_formatted(py):
+    """Check `py` against `black`, in-process.
+
+    Results are cached in `BLACK_CACHE_DIR`, keyed by the hash of the script
+    and the `black` version, so unchanged scripts aren't formatted again.
+    """
+    digest = hashlib.sha256((black.__version__ + "\0" + py).encode("utf-8"))
+    cache_path = Path(BLACK_CACHE_DIR) / digest.hexdigest()
+    if os.path.exists(cache_path):
+        return open(cache_path).read() == "1"
+    try:
+        formatted = black.format_str(py, mode=black.Mode())
+    except black.InvalidInput as e:
+        raise ValueError(f"Could not parse your python file with `black`: {e}")
+    result = formatted == py
+    os.makedirs(BLACK_CACHE_DIR, exist_ok=True)
+    # Write atomically, since validation runs in several processes at once.
+    tmp_path = str(cache_path) + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("1" if result else "0")
+    os.replace(tmp_path, cache_path)
+    return result
+
+
+def validate_all(paths, processes=None):
+    """Validate many tutobook scripts in parallel and print a report.
+
+    Returns a dict mapping each path that failed validation to its error.
+    """
+    with multiprocessing.Pool(processes or os.cpu_count()) as pool:
+        results = pool.map(_validate_file, paths)
+    errors = {path: error for path, error in zip(paths, results) if error}
+    for path, error in errors.items():
+        print(f"...FAILED {path}: {error}")
+    print(f"Validated {len(paths)} tutobooks: {len(errors)} failed.")
+    return errors
+
+
+def _validate_file(py_path):
+    try:
+        validate(open(py_path).read())
+    except ValueError as e:
+        return str(e)
+    except Exception as e:
+        # e.g. an unreadable file: report it instead of failing the whole run.
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
 def count_locs_in_file(py_path):
     f = open(py_path)
     py = f.read()
     f.close()
-    _get_next_script_element(py)  # Header
     loc = 0
-    while py:
-        e, cell_type, py, _ = _get_next_script_element(py)
-        lines = e.split("\n")
-        if cell_type == "code":
-            loc += _count_locs(lines)
+    for cell in parse_script(py):
+        if cell.cell_type == "code":
+            loc += _count_locs(cell.lines)
     return loc
 
 
@@ -420,36 +550,47 @@ def _shorten_lines(py):
     return "\n".join(lines)
 
 
-def _get_next_script_element(py):
+def parse_script(py):
+    """Split a tutobook script into a list of `ScriptCell`s, in a single pass.
+
+    Text cells are fenced by lines starting with `\"\"\"`; everything between
+    two text cells is a code cell. The first text cell is the header. Cell
+    types are "header", "markdown", "shell", "invisible" and "code".
+    """
     lines = py.split("\n")
-    assert lines
-    elines = []
+    cells = []
     i = 0
-    tag = None
-    if lines[0].startswith('"""'):
-        assert len(lines) >= 2
-        etype = "markdown"
-        if len(lines[0]) > 3:
-            tag = lines[0][3:]
-            if tag not in ["shell", "invisible"]:
-                raise ValueError("Found unknown cell tag:", tag)
-        lines = lines[1:]
-    else:
-        etype = "code"
-
-    for i, line in enumerate(lines):
-        if line.startswith('"""'):
-            break
+    # A trailing newline doesn't start a new cell.
+    while i < len(lines) and not (i == len(lines) - 1 and not lines[i]):
+        lineno = i + 1
+        if lines[i].startswith('"""'):
+            tag = lines[i][3:]
+            if tag and tag not in ("shell", "invisible"):
+                raise ValueError(f"Found unknown cell tag `{tag}` on line {lineno}.")
+            if not cells:
+                cell_type = "header"
+            else:
+                cell_type = tag or "markdown"
+            end = _find_fence(lines, i + 1)
+            cells.append(ScriptCell(cell_type, lines[i + 1 : end], lineno))
+            i = end + 1
         else:
-            elines.append(line)
+            end = _find_fence(lines, i)
+            if end == len(lines) and lines[-1]:
+                raise ValueError(
+                    f"Script should end with a newline (line {len(lines)})."
+                )
+            cells.append(ScriptCell("code", lines[i:end], lineno))
+            i = end
+    return cells
 
-    if etype == "markdown":
-        py = "\n".join(lines[i + 1 :])
-    else:
-        py = "\n".join(lines[i:])
-    e = "\n".join(elines)
 
-    return e, etype, py, tag
+def _find_fence(lines, start):
+    """Index of the first line starting with `\"\"\"` after `start`."""
+    for i in range(start, len(lines)):
+        if lines[i].startswith('"""'):
+            return i
+    return len(lines)
 
 
 def _parse_header(header):
@@ -563,17 +704,70 @@ NB_BASE = {
 
 if __name__ == "__main__":
     cmd = sys.argv[1]
-    if cmd not in {"nb2py", "py2nb", "count_loc"}:
+    if cmd not in {
+        "nb2py",
+        "py2nb",
+        "count_loc",
+        "validate_all",
+        "profile_report",
+        "run_all",
+        "index",
+    }:
         raise ValueError(
             "Specify a command: either "
             "`nb2py source_filename.ipynb target_filename.py` or "
             "`py2nb source_filename.py target_file name.ipynb` or "
-            "`count_loc source_filename.py`."
+            "`count_loc source_filename.py` or "
+            "`validate_all [source_filename.py ...]` or "
+            "`profile_report [source_filename.profile.json ...]` or "
+            "`run_all [--smoke] [source_filename.py ...]` or "
+            "`index [--uses api ...]`."
         )
     if cmd == "count_loc":
         source = sys.argv[2]
         loc = count_locs_in_file(source)
         print(f"Counted {loc} lines of code in {source}.")
+    elif cmd in ("validate_all", "run_all"):
+        sources = [arg for arg in sys.argv[2:] if not arg.startswith("--")]
+        if not sources:
+            # All guides and examples.
+            root = Path(__file__).parent.parent
+            sources = sorted(glob.glob(str(root / "guides" / "*.py")))
+            sources += sorted(glob.glob(str(root / "examples" / "*" / "*.py")))
+        if cmd == "validate_all":
+            if validate_all(sources):
+                sys.exit(1)
+        else:
+            # Imported here since `tutobook_scheduler` imports this module.
+            import tutobook_scheduler
+
+            results = tutobook_scheduler.run_tutobooks(
+                sources, smoke="--smoke" in sys.argv
+            )
+            if not all(result["success"] for result in results):
+                sys.exit(1)
+    elif cmd == "index":
+        # Imported here since `tutobook_index` imports this module.
+        import tutobook_index
+
+        root = Path(__file__).parent.parent
+        sources = sorted(glob.glob(str(root / "guides" / "*.py")))
+        sources += sorted(glob.glob(str(root / "examples" / "*" / "*.py")))
+        index = tutobook_index.TutobookIndex()
+        index.update(sources)
+        if "--uses" in sys.argv:
+            apis = sys.argv[sys.argv.index("--uses") + 1 :]
+            for name in index.get_tutobooks_to_rerun(apis):
+                print(name)
+        index.close()
+    elif cmd == "profile_report":
+        sources = sys.argv[2:]
+        if not sources:
+            # Profiles saved by the last runs of all guides and examples.
+            root = Path(__file__).parent.parent
+            sources = glob.glob(str(root / "guides" / "md" / "*.profile.json"))
+            sources += glob.glob(str(root / "examples" / "*" / "md" / "*.profile.json"))
+        profile_report(sources)
     else:
         if len(sys.argv) < 4:
             raise ValueError("Specify a source filename and a target filename")
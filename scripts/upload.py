@@ -1,23 +1,107 @@
+"""Upload the post-build `site/` contents to S3.
+
+Files are uploaded from a pool of threads sharing one S3 client. Large
+files are sent as multipart uploads (see `MULTIPART_THRESHOLD`), text assets
+are compressed before upload and served with a matching `Content-Encoding`,
+and every object gets a `Cache-Control` header: hashed media file names (see
+`media_store`) never change content, so they are cached forever. Failed
+uploads are retried with exponential backoff, and a throughput report is
+printed at the end.
+
+Only files whose content (or upload settings) changed since the last upload
+are sent, based on a hash cache stored in the bucket.
+
+USAGE:
+
+python upload.py
+python upload.py --workers=16
+
+Set `AWS_S3_ENDPOINT_URL` to upload to a local S3 stand-in (e.g. MinIO).
+"""
+
 import boto3
+import boto3.exceptions
+import botocore.config
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
 from pathlib import Path
 import mimetypes
 import hashlib
+import gzip
+import io
 import os
 import json
+import random
+import re
+import sys
+import threading
+import time
 from multiprocessing.pool import ThreadPool
 
-AKEY = os.environ["AWS_S3_ACCESS_KEY"]
-SKEY = os.environ["AWS_S3_SECRET_KEY"]
+import media_store
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 BUCKET = "keras.io"
 USE_THREADING = True
 HASH_CACHE = "contents_hashes.json"
+# Number of files uploaded concurrently.
+UPLOAD_WORKERS = 8
+# Files larger than this are sent as multipart uploads, in parts of
+# `MULTIPART_CHUNKSIZE`, with up to `MULTIPART_CONCURRENCY` parts in flight.
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+# Attempts per file, waiting `RETRY_BASE_DELAY * 2 ** attempt` seconds
+# (with jitter, at most `RETRY_MAX_DELAY`) between them.
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# S3 errors that won't go away by trying again.
+NON_RETRYABLE_ERRORS = (
+    "AccessDenied",
+    "InvalidAccessKeyId",
+    "NoSuchBucket",
+    "SignatureDoesNotMatch",
+)
+# "gzip" or "br". S3 doesn't negotiate encodings, so every client gets the
+# stored one: "br" requires all clients (and any CDN in front) to accept it.
+CONTENT_ENCODING = "gzip"
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+    "text/xml",
+)
+# Smaller files aren't worth compressing.
+MIN_COMPRESS_SIZE = 1024
+HTML_CACHE_CONTROL = "public, max-age=600"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_HASHED_NAME = re.compile(r"^[0-9a-f]{%d}\." % media_store.DIGEST_LENGTH)
 
-s3 = boto3.client("s3", aws_access_key_id=AKEY, aws_secret_access_key=SKEY)
+
+def make_client(max_pool_connections=10):
+    return boto3.client(
+        "s3",
+        aws_access_key_id=os.environ.get("AWS_S3_ACCESS_KEY"),
+        aws_secret_access_key=os.environ.get("AWS_S3_SECRET_KEY"),
+        endpoint_url=os.environ.get("AWS_S3_ENDPOINT_URL"),
+        config=botocore.config.Config(max_pool_connections=max_pool_connections),
+    )
 
 
-def hash_file(fpath):
-    h = hashlib.sha256()
+def hash_file(fpath, salt=""):
+    h = hashlib.sha256(salt.encode("utf-8"))
     b = bytearray(128 * 1024)
     mv = memoryview(b)
     with open(fpath, "rb", buffering=0) as f:
@@ -26,44 +110,200 @@ def hash_file(fpath):
     return h.hexdigest()[:8]
 
 
-def upload_file(bucket, fpath, key_name, redirect=None):
-    print(f"...Upload to {bucket}:{key_name}")
-    mime = mimetypes.guess_type(fpath)[0]
-    extra_args = {"ContentType": mime, "ACL": "public-read"}
-    if redirect:
-        extra_args["WebsiteRedirectLocation"] = redirect
-    s3.upload_file(
-        fpath, bucket, key_name, ExtraArgs={"ContentType": mime, "ACL": "public-read"}
-    )
+def get_cache_control(key_name, mime):
+    if _HASHED_NAME.match(os.path.basename(key_name)):
+        return IMMUTABLE_CACHE_CONTROL
+    if mime == "text/html":
+        return HTML_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        # A fixed mtime keeps the output deterministic.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br":
+        if brotli is None:
+            raise ValueError(
+                "Brotli compression requires the `brotli` package "
+                "(`pip install brotli`)."
+            )
+        return brotli.compress(data, mode=brotli.MODE_TEXT)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def is_retryable(error):
+    if isinstance(error, botocore.exceptions.ClientError):
+        return error.response.get("Error", {}).get("Code") not in NON_RETRYABLE_ERRORS
+    return True
+
+
+class Uploader:
+    """Uploads files to an S3 bucket and keeps throughput statistics.
+
+    The client can be passed explicitly, e.g. a client of a local S3
+    stand-in (moto, MinIO) for testing.
+    """
+
+    def __init__(
+        self,
+        bucket=BUCKET,
+        workers=UPLOAD_WORKERS,
+        client=None,
+        content_encoding=CONTENT_ENCODING,
+    ):
+        self.bucket = bucket
+        self.workers = workers
+        self.content_encoding = content_encoding
+        # Every multipart part in flight needs its own connection.
+        self.client = client or make_client(
+            max_pool_connections=workers * MULTIPART_CONCURRENCY
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=MULTIPART_CONCURRENCY,
+        )
+        self._lock = threading.Lock()
+        self.reset_stats()
 
+    def reset_stats(self):
+        self.stats = {
+            "files": 0,
+            "bytes": 0,  # On disk
+            "bytes_sent": 0,  # After compression
+            "retries": 0,
+            "failures": 0,
+        }
+        self.start_time = time.time()
 
-def load_hash_cache():
+    def get_upload_args(self, fpath, key_name, redirect=None, encode=True):
+        """`ExtraArgs` of the upload of `fpath` (compressed if `encode`)."""
+        mime = mimetypes.guess_type(fpath)[0] or "application/octet-stream"
+        extra_args = {
+            "ContentType": mime,
+            "ACL": "public-read",
+            "CacheControl": get_cache_control(key_name, mime),
+        }
+        if (
+            encode
+            and self.content_encoding
+            and mime in COMPRESSIBLE_TYPES
+            and os.path.getsize(fpath) >= MIN_COMPRESS_SIZE
+        ):
+            extra_args["ContentEncoding"] = self.content_encoding
+        if redirect:
+            extra_args["WebsiteRedirectLocation"] = redirect
+        return extra_args
+
+    def get_upload_hash(self, fpath, key_name):
+        """Hash of the file and of its upload settings, for the hash cache."""
+        extra_args = self.get_upload_args(fpath, key_name)
+        return hash_file(fpath, salt=json.dumps(extra_args, sort_keys=True))
+
+    def upload_file(self, fpath, key_name, redirect=None, encode=True):
+        """Upload one file, retrying on errors. Returns whether it succeeded."""
+        print(f"...Upload to {self.bucket}:{key_name}")
+        extra_args = self.get_upload_args(
+            fpath, key_name, redirect=redirect, encode=encode
+        )
+        size = os.path.getsize(fpath)
+        data = None
+        if "ContentEncoding" in extra_args:
+            with open(fpath, "rb") as f:
+                data = compress(f.read(), extra_args["ContentEncoding"])
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if data is None:
+                    self.client.upload_file(
+                        fpath,
+                        self.bucket,
+                        key_name,
+                        ExtraArgs=extra_args,
+                        Config=self.transfer_config,
+                    )
+                else:
+                    self.client.upload_fileobj(
+                        io.BytesIO(data),
+                        self.bucket,
+                        key_name,
+                        ExtraArgs=extra_args,
+                        Config=self.transfer_config,
+                    )
+                break
+            except (
+                boto3.exceptions.S3UploadFailedError,
+                botocore.exceptions.BotoCoreError,
+                botocore.exceptions.ClientError,
+            ) as e:
+                if attempt == MAX_ATTEMPTS - 1 or not is_retryable(e):
+                    print(f"[ERROR] Could not upload {key_name}: {e}")
+                    with self._lock:
+                        self.stats["failures"] += 1
+                    return False
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+                delay *= random.uniform(0.5, 1)
+                print(f"[RETRY] {key_name} in {delay:.1f}s: {e}")
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+        with self._lock:
+            self.stats["files"] += 1
+            self.stats["bytes"] += size
+            self.stats["bytes_sent"] += size if data is None else len(data)
+        return True
+
+    def upload_files(self, targets):
+        """Upload `(fpath, key_name)` pairs. Returns the keys that failed."""
+        self.reset_stats()
+        if USE_THREADING and self.workers > 1:
+            with ThreadPool(processes=self.workers) as pool:
+                results = pool.map(lambda args: self.upload_file(*args), targets)
+        else:
+            results = [self.upload_file(*args) for args in targets]
+        self.print_report()
+        return [key_name for (_, key_name), ok in zip(targets, results) if not ok]
+
+    def print_report(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        stats = self.stats
+        mb = stats["bytes"] / 1024 / 1024
+        mb_sent = stats["bytes_sent"] / 1024 / 1024
+        print(
+            f"Uploaded {stats['files']} files ({mb:.1f} MB, {mb_sent:.1f} MB sent) "
+            f"in {elapsed:.1f}s with {self.workers} workers: "
+            f"{mb_sent / elapsed:.2f} MB/s, {stats['files'] / elapsed:.1f} files/s, "
+            f"{stats['retries']} retries, {stats['failures']} failures"
+        )
+
+
+def load_hash_cache(uploader):
     try:
-        s3.download_file(BUCKET, HASH_CACHE, HASH_CACHE)
+        uploader.client.download_file(uploader.bucket, HASH_CACHE, HASH_CACHE)
     except:
         print(f"[ERROR] Could not dowload hash cache {HASH_CACHE}")
         return {}
-    with open(HASH_CACHE) as f:
+    with open(HASH_CACHE, "rb") as f:
         contents = f.read()
-        return json.loads(contents)
+    # The cache is stored uncompressed, but tolerate a gzip-encoded one.
+    if contents.startswith(b"\x1f\x8b"):
+        contents = gzip.decompress(contents)
+    return json.loads(contents)
 
 
-def save_hash_cache(hash_cache):
+def save_hash_cache(uploader, hash_cache):
     with open(HASH_CACHE, "w") as f:
         f.write(json.dumps(hash_cache))
-    upload_file(BUCKET, HASH_CACHE, HASH_CACHE)
-
+    # Stored as is, since `load_hash_cache` reads the raw object.
+    if not uploader.upload_file(HASH_CACHE, HASH_CACHE, encode=False):
+        raise RuntimeError(f"Could not upload hash cache {HASH_CACHE}")
 
-def wrapped_upload_file(args):
-    bucket, fpath, key_name = args
-    upload_file(bucket, fpath, key_name)
 
-
-def cleanup(site_directory, redirect_directory):
-    paginator = s3.get_paginator("list_objects_v2")
-    page_iterator = paginator.paginate(Bucket=BUCKET)
+def cleanup(uploader, site_directory, redirect_directory):
+    paginator = uploader.client.get_paginator("list_objects_v2")
+    page_iterator = paginator.paginate(Bucket=uploader.bucket)
     for page in page_iterator:
-        for obj in page["Contents"]:
+        for obj in page.get("Contents", []):
             key = obj["Key"]
             if key.endswith(".html"):
                 site_fpath = os.path.join(site_directory, key)
@@ -72,10 +312,15 @@ def cleanup(site_directory, redirect_directory):
                     redirect_fpath
                 ):
                     print(f"[DELETE] {key}")
-                    s3.delete_object(Bucket=BUCKET, Key=key)
+                    uploader.client.delete_object(Bucket=uploader.bucket, Key=key)
+
 
+def upload_dir(uploader, directory, include_img=True, hash_cache=None):
+    """Upload a directory. Returns the updated hash cache, if one is given.
 
-def upload_dir(directory, include_img=True, hash_cache=None):
+    Files that could not be uploaded are left out of the returned hash cache,
+    so that they are uploaded again next time.
+    """
     print(f"Uploading files from '{directory}'...")
     all_targets = []
     for dp, _, fn in os.walk(directory):
@@ -89,31 +334,34 @@ def upload_dir(directory, include_img=True, hash_cache=None):
                 key_name = fpath[len(directory) :]
                 key_name = key_name.removeprefix("/")
                 print(f"...{key_name}")
-                all_targets.append((BUCKET, fpath, key_name))
+                all_targets.append((fpath, key_name))
 
     if hash_cache is not None:
         filtered_targets = []
         new_hash_cache = {}
-        for bucket, fpath, key_name in all_targets:
-            new_hash = hash_file(fpath)
+        for fpath, key_name in all_targets:
+            new_hash = uploader.get_upload_hash(fpath, key_name)
             old_hash = hash_cache.get(key_name)
             if new_hash != old_hash:
-                filtered_targets.append((bucket, fpath, key_name))
+                filtered_targets.append((fpath, key_name))
             new_hash_cache[key_name] = new_hash
+        print(
+            f"{len(filtered_targets)} files to upload "
+            f"({len(all_targets) - len(filtered_targets)} unchanged)"
+        )
         all_targets = filtered_targets
 
-    if USE_THREADING:
-        pool = ThreadPool(processes=8)
-        pool.map(wrapped_upload_file, all_targets)
-    else:
-        for args in all_targets:
-            wrapped_upload_file(args)
+    failed = uploader.upload_files(all_targets)
 
     if hash_cache is not None:
+        for key_name in failed:
+            new_hash_cache.pop(key_name)
         return new_hash_cache
+    if failed:
+        raise RuntimeError(f"Could not upload {len(failed)} files: {failed}")
 
 
-def upload_redirects(directory):
+def upload_redirects(uploader, directory):
     print("Uploading redirects...")
     for dp, _, fn in os.walk(directory):
         if fn:
@@ -127,13 +375,32 @@ def upload_redirects(directory):
                 print(fpath)
                 print(url)
                 key_name = fpath[len(directory) :]
-                upload_file(BUCKET, fpath, key_name, redirect=url)
+                key_name = key_name.removeprefix("/")
+                uploader.upload_file(fpath, key_name, redirect=url)
 
 
-if __name__ == "__main__":
-    root = Path(__file__).parent.parent.resolve()
-    hash_cache = load_hash_cache()
+def get_workers(argv):
+    for arg in argv:
+        if arg.startswith("--workers="):
+            return int(arg[len("--workers=") :])
+    return UPLOAD_WORKERS
+
+
+def main(uploader, site_directory):
+    """Upload the site. Returns non-zero if some files could not be uploaded."""
+    hash_cache = load_hash_cache(uploader)
     hash_cache = upload_dir(
-        os.path.join(root, "site"), include_img=True, hash_cache=hash_cache
+        uploader, site_directory, include_img=True, hash_cache=hash_cache
     )
-    save_hash_cache(hash_cache)
+    save_hash_cache(uploader, hash_cache)
+    failures = uploader.stats["failures"]
+    if failures:
+        print(f"[ERROR] {failures} files could not be uploaded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    root = Path(__file__).parent.parent.resolve()
+    uploader = Uploader(workers=get_workers(sys.argv))
+    sys.exit(main(uploader, os.path.join(root, "site")))